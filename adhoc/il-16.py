@@ -14,8 +14,9 @@ import os
 import pandas as pd
 import numpy as np
 
+from district_research.cache import ACSCache
 from district_research.data.acs import get_acs_data_table
-from district_research.data.elections import get_general_election_results
+from district_research.data.elections import read_general_election_df
 
 def create_il16_primary_county_results():
 
@@ -60,29 +61,6 @@ def create_il16_primary_results():
     return county_df.drop('Election', axis=1)
 
 
-def _create_house_view():
-    """Creates the house view that'll be used to plot general election results."""
-    df = (
-        pd.read_csv('data/1976-2018-house3.csv')
-        [['year', 'state_po', 'district', 'party', 'candidatevotes', 'stage']]
-    )
-    df2020 = (
-        pd.read_csv('data/2020-house-full.csv')
-        [['year', 'state_po', 'district', 'party', 'candidatevotes', 'stage']]
-    )
-
-    final_df = pd.concat([df, df2020], axis=0)
-
-    final_df['district'] = (
-        final_df['district']
-        .replace(0, 1)
-        .astype(str)
-        .str.pad(2, 'left', '0')
-    )
-
-    return final_df
-
-
 def main():
 
     # get desired indicators in dict format
@@ -90,6 +68,7 @@ def main():
     # pull for all counties filter to counties in il-16
     with open('conf/censuskey.txt', 'r') as f:
         api_key = f.read()
+    cache = ACSCache()
     
     state_codes = pd.read_csv('data/state_codes.txt', sep='|')
     state_codes['STATE'] = state_codes['STATE'].astype(str).str.pad(2, 'left', '0')
@@ -140,7 +119,7 @@ def main():
     # used acs5 because acs1 had limited coverage of counties
     # county indicators
     county_df = (
-        get_acs_data_table(api_key, 'acs5', 2019, 'COUNTY', '*', *indicators)
+        get_acs_data_table(api_key, 'acs5', 2019, 'COUNTY', '*', *indicators, cache=cache)
         .rename(columns={'state':'STATE'})
         .merge(state_codes, how='left', on='STATE')
         .drop([c+'A' for c in indicators], axis=1)
@@ -167,7 +146,8 @@ def main():
             2019,
             'congressional district',
             '*',
-            *indicators)
+            *indicators,
+            cache=cache)
         .rename(columns={'state':'STATE'})
         .merge(state_codes, how='left', on='STATE')
         .drop([c+'A' for c in indicators], axis=1)
@@ -179,10 +159,10 @@ def main():
     ][indicators.values()].T
 
     # election results -- general
-    house_df = _create_house_view()
+    house_df = read_general_election_df('house')
     il_16_cong_elections = (house_df[
         (house_df['state_po'] == 'IL')
-        & (house_df['district'] == '16')
+        & (house_df['district'] == 16)
         & (house_df['year'] >= 2010)
     ])
 
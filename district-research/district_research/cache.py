@@ -0,0 +1,318 @@
+"""Small on-disk caches used to avoid redoing slow work between runs, such as
+    downloading ACS tables that never change once they are published.
+"""
+import collections
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+import pyarrow.feather as feather
+
+
+class OfflineCacheMiss(LookupError):
+    """Raised when a cache is in offline mode and does not hold a requested
+        entry. Offline mode never falls back to the network.
+    """
+
+
+def make_key(*parts):
+    """Hashes any json serializable parts into a key that is safe to use as
+        a file name.
+    """
+    raw = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def file_digest(*paths):
+    """Hashes the contents of one or more files."""
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+
+    return digest.hexdigest()
+
+
+def read_cached_frame(cache_dir, name, sources, build, version=1):
+    """Returns the DataFrame that build() creates from the files in sources.
+        The result is stored as an uncompressed feather file named after the
+        hash of the sources, so later calls are a memory mapped read until one
+        of the sources changes. The hash is remembered next to the feather
+        files with each source's modification time and size, and sources are
+        only hashed again when one of those changes.
+
+        Args:
+            cache_dir (str): Directory the feather files are stored in.
+            name (str): Name of the dataset, used as the file prefix.
+            sources (list): Paths of the files the dataset is built from.
+            build (callable): Function that builds the DataFrame from scratch.
+            version (int): Bump when build changes so old files are ignored.
+
+        Returns:
+            A DataFrame with a default index.
+    """
+    key = make_key(version, _sources_digest(cache_dir, name, sources))[:16]
+    path = os.path.join(cache_dir, f'{name}-{key}.feather')
+
+    if os.path.exists(path):
+        return feather.read_table(path, memory_map=True).to_pandas()
+
+    df = build().reset_index(drop=True)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}-{threading.get_ident()}.tmp'
+    feather.write_feather(df, tmp_path, compression='uncompressed')
+    os.replace(tmp_path, path)
+
+    # files built from older versions of the sources will never be read again
+    filename = os.path.basename(path)
+    for other in os.listdir(cache_dir):
+        if (other != filename and other.startswith(f'{name}-')
+            and other.endswith('.feather') and len(other) == len(filename)):
+            os.remove(os.path.join(cache_dir, other))
+
+    return df
+
+
+def _sources_digest(cache_dir, name, sources):
+    """file_digest of sources, reusing the digest stored in cache_dir when no
+        source's path, modification time or size has changed since it was
+        computed."""
+    stats = []
+    for path in sources:
+        stat = os.stat(path)
+        stats.append([os.path.abspath(path), stat.st_mtime_ns, stat.st_size])
+
+    path = os.path.join(cache_dir, f'{name}.sources.json')
+    try:
+        with open(path) as f:
+            stored = json.load(f)
+        if stored['sources'] == stats:
+            return stored['digest']
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+
+    digest = file_digest(*sources)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}-{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'sources': stats, 'digest': digest}, f)
+    os.replace(tmp_path, path)
+
+    return digest
+
+
+class DiskCache:
+    """A directory of blobs keyed by a hash. Entries are evicted least recently
+        used first once the directory grows past max_bytes.
+
+        Args:
+            cache_dir (str): Directory the entries are stored in. Created if it
+                does not exist.
+            max_bytes (int): Size the directory is trimmed back to after every
+                write.
+            suffix (str): File extension given to every entry.
+    """
+
+    def __init__(self, cache_dir, max_bytes=512 * 1024 ** 2, suffix=''):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + self.suffix)
+
+    def get(self, key, ttl=None):
+        """Returns the bytes stored under key, or None if there is no entry or
+            the entry is older than ttl seconds.
+        """
+        path = self.path(key)
+        try:
+            stat = os.stat(path)
+            if ttl is not None and time.time() - stat.st_mtime > ttl:
+                return None
+
+            with open(path, 'rb') as f:
+                content = f.read()
+
+            # access time drives eviction, but many filesystems are mounted
+            # with noatime so we set it ourselves. mtime is kept for the ttl.
+            os.utime(path, (time.time(), stat.st_mtime))
+        except FileNotFoundError:
+            # evicted by another thread or process while we were reading
+            return None
+
+        return content
+
+    def put(self, key, content, evict=True):
+        """Atomically writes content under key and trims the cache. Pass
+            evict=False when writing many entries and call evict once after.
+        """
+        path = self.path(key)
+        tmp_path = f'{path}.{os.getpid()}-{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """Removes the least recently used entries until the cache is no
+            larger than max_bytes.
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(self.suffix) or name.endswith('.tmp'):
+                continue
+            # other threads or processes may be evicting at the same time, so
+            # entries can disappear underneath us.
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+class ACSCache(DiskCache):
+    """Cache of ACS API responses. Responses are stored as gzipped JSON and
+        keyed on (est, year, geo, geo_val, sorted codes).
+
+        Published ACS vintages never change, so they are kept until evicted.
+        Vintages that may still be unpublished or revised (the last two years)
+        expire after ttl seconds.
+
+        Args:
+            cache_dir (str): Directory the responses are stored in.
+            max_bytes (int): Size the cache is trimmed back to.
+            ttl (int): Seconds before a response for a recent vintage expires.
+            offline (bool): If True, a cache miss raises OfflineCacheMiss
+                instead of requesting data from the Census API.
+    """
+
+    def __init__(self, cache_dir='data/cache/acs', max_bytes=1024 ** 3,
+        ttl=24 * 60 * 60, offline=False):
+        super().__init__(cache_dir, max_bytes, suffix='.json.gz')
+        self.ttl = ttl
+        self.offline = offline
+
+    @staticmethod
+    def key(est, year, geo, geo_val, codes):
+        return make_key(est, int(year), geo.lower(), geo_val, sorted(codes))
+
+    @staticmethod
+    def is_published(year):
+        # ACS estimates for a year are released over the course of the
+        # following year, so anything two or more years back is final.
+        return int(year) <= datetime.date.today().year - 2
+
+    def get_compressed(self, est, year, geo, geo_val, codes):
+        """Returns the cached API response as gzipped JSON bytes, or None."""
+        ttl = None if self.is_published(year) else self.ttl
+        content = self.get(self.key(est, year, geo, geo_val, codes), ttl)
+
+        if content is None and self.offline:
+            raise OfflineCacheMiss(
+                f'No cached {est} {year} response for {geo}:{geo_val} '
+                f'and the cache is offline.'
+            )
+
+        return content
+
+    def put_compressed(self, est, year, geo, geo_val, codes, content):
+        """Stores an API response that is already gzipped JSON."""
+        self.put(self.key(est, year, geo, geo_val, codes), content)
+
+    def get_payload(self, est, year, geo, geo_val, codes):
+        """Returns the cached API response as a list of rows, or None."""
+        content = self.get_compressed(est, year, geo, geo_val, codes)
+        return json.loads(gzip.decompress(content)) if content is not None else None
+
+    def put_payload(self, est, year, geo, geo_val, codes, payload):
+        """Stores an API response (list of rows) for later runs."""
+        content = gzip.compress(
+            json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        )
+        self.put_compressed(est, year, geo, geo_val, codes, content)
+
+
+class MapCache(DiskCache):
+    """Cache of rendered maps as PNG bytes, used by the dashboard and the batch
+        map jobs. Entries are keyed on what a map shows: the district, the
+        characteristic, a hash of the data it is drawn from (shapes included)
+        and the style, so a map is only drawn again when one of those changes.
+        Both draw maps the same way, but the dashboard's shapes are simplified
+        and its titles differ, so in practice each only reuses its own maps.
+
+        The most recently used maps are also held in memory, so going back to
+        a map that was just shown doesn't read the disk.
+
+        Args:
+            cache_dir (str): Directory the maps are stored in.
+            max_bytes (int): Size the cache is trimmed back to.
+            memory_items (int): Number of maps held in memory.
+    """
+
+    def __init__(self, cache_dir='data/cache/maps', max_bytes=256 * 1024 ** 2,
+        memory_items=64):
+        super().__init__(cache_dir, max_bytes, suffix='.png')
+        self.memory_items = memory_items
+        self._recent = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(district, characteristic, data_version, style):
+        return make_key(district, characteristic, data_version, style)
+
+    def __getstate__(self):
+        # batch map jobs send the cache to worker processes, which start with
+        # an empty memory cache of their own
+        state = self.__dict__.copy()
+        del state['_lock'], state['_recent']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._recent = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, ttl=None):
+        if ttl is None:
+            with self._lock:
+                content = self._recent.get(key)
+                if content is not None:
+                    self._recent.move_to_end(key)
+                    return content
+
+        content = super().get(key, ttl)
+        if content is not None:
+            self._remember(key, content)
+
+        return content
+
+    def put(self, key, content, evict=True):
+        super().put(key, content, evict)
+        self._remember(key, content)
+
+    def _remember(self, key, content):
+        with self._lock:
+            self._recent[key] = content
+            self._recent.move_to_end(key)
+            while len(self._recent) > self.memory_items:
+                self._recent.popitem(last=False)
@@ -3,12 +3,62 @@ Code to interact with American Community Survey data using Census API.
 Is only for five year estimates. We will use this in place of the python package
 census when they do not support something.
 """
+import json
+import threading
+import time
+import zlib
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
+import numpy as np
 import pandas as pd
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ChunkedEncodingError
 
-def get_acs_data_table(api_key, est, year, geo, geo_val, *codes):
-    """Creates a table of socioeconomic indicators for either ACS1 or ACS5 
+# status codes that are worth retrying. The Census API returns these when it is
+# overloaded or we are being rate limited.
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# the census api allows at most 50 variables per call. Every code is requested
+# along with its annotation, so each call can hold 25 codes.
+MAX_CODES_PER_REQUEST = 25
+
+# size of the pieces a response body is read and decoded in when streaming
+STREAM_CHUNK_SIZE = 1 << 16
+
+
+class RateLimiter:
+    """Spaces out requests so that no more than requests_per_second start each
+        second, across every thread that shares the limiter.
+    """
+
+    def __init__(self, requests_per_second):
+        self.interval = 1 / requests_per_second if requests_per_second else 0
+        self._next_start = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.interval
+        time.sleep(start - now)
+
+
+def make_session(pool_size=8):
+    """Creates a requests session whose connection pool can serve pool_size
+        concurrent requests to the Census API.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_acs_data_table(api_key, est, year, geo, geo_val, *codes, cache=None,
+    session=None, retries=3, rate_limiter=None, stream=False):
+    """Creates a table of socioeconomic indicators for either ACS1 or ACS5
         indicators for a given year for certain geographic levels. For example,
         we can create ACS5 socioeconomic estimates for ZCTAs (Census version of
         zip codes) in the year 2019.
@@ -21,22 +71,405 @@ def get_acs_data_table(api_key, est, year, geo, geo_val, *codes):
             geo_val (str): A comma delimited string of the geographies to grab
                 data for. If one wants all just put '*'
             codes (str): args that indicate the different census socioeconomic
-                codes.
-        
+                codes. There is no limit on how many; lists longer than the
+                API allows are fetched in chunks.
+            cache (ACSCache): Optional on-disk cache of responses. When given,
+                a cached response is used instead of calling the API.
+            session (requests.Session): Optional session to reuse connections
+                across calls.
+            retries (int): Number of times to retry a failed request.
+            rate_limiter (RateLimiter): Optional limiter shared across calls.
+            stream (bool): Decode the response into columns as it downloads.
+                Uses a fraction of the peak memory for large tables such as
+                every ZCTA.
+
         Returns
-            A DataFrame with every geography and its associated socioeconomic 
+            A DataFrame with every geography and its associated socioeconomic
                 values.
     """
 
+    codes, chunks = _chunk_codes(year, codes)
+
+    def fetch(chunk):
+        return _get_acs_frame(
+            api_key, est, year, geo, geo_val, chunk, cache=cache,
+            session=session, retries=retries, rate_limiter=rate_limiter,
+            stream=stream
+        )
+
+    # wide requests are fetched at the same time and joined back together on
+    # the geography columns.
+    if len(chunks) == 1:
+        frames = [fetch(chunks[0])]
+    else:
+        with ThreadPoolExecutor(len(chunks)) as pool:
+            frames = list(pool.map(fetch, chunks))
+
+    return _finish_table(frames, codes, year)
+
+
+def get_acs_data_tables(api_key, jobs, *codes, geo_val='*', max_workers=8,
+    requests_per_second=10, retries=3, cache=None, stream=False, concat=True):
+    """Fetches several ACS tables concurrently over a shared connection pool.
+        For example, every year from 2017 to 2019 for both congressional
+        districts and states.
+
+        Args:
+            api_key (str): The API Key used to access ACS data
+            jobs (list): Tuples of (est, year, geo). A job can carry its own
+                codes as a fourth element, e.g. (est, year, geo, codes), for
+                years where the census codes differ.
+            codes (str): Codes used by every job that doesn't list its own.
+            geo_val (str): The geographies to grab data for, '*' for all.
+            max_workers (int): Number of requests in flight at once.
+            requests_per_second (float): Cap on how fast requests are started.
+            retries (int): Number of times to retry a failed request.
+            cache (ACSCache): Optional on-disk cache of responses.
+            stream (bool): Decode responses as they download, see
+                get_acs_data_table.
+            concat (bool): If False, return a list of DataFrames in the same
+                order as jobs instead of concatenating them.
+
+        Returns:
+            A DataFrame with the results of every job stacked together.
+    """
+    rate_limiter = RateLimiter(requests_per_second)
+
+    with make_session(max_workers) as session:
+        # every chunk of every job goes to the same pool, so no more than
+        # max_workers requests are ever in flight.
+        with ThreadPoolExecutor(max_workers) as pool:
+            pending = []
+            for job in jobs:
+                est, year, geo = job[:3]
+                job_codes, chunks = _chunk_codes(year, job[3] if len(job) > 3 else codes)
+                futures = [
+                    pool.submit(
+                        _get_acs_frame, api_key, est, year, geo, geo_val, chunk,
+                        cache=cache, session=session, retries=retries,
+                        rate_limiter=rate_limiter, stream=stream
+                    )
+                    for chunk in chunks
+                ]
+                pending.append((futures, job_codes, year))
+
+            tables = [
+                _finish_table([f.result() for f in futures], job_codes, year)
+                for futures, job_codes, year in pending
+            ]
+
+    if not concat:
+        return tables
+
+    return pd.concat(tables).reset_index(drop=True)
+
+
+def available_codes(year, codes):
+    """Returns the codes the profile API has for a year, in order."""
     # removing the voting age population citizens metric for years prior bc
     # the census doesn't seem to have it for any year after this one.
-    if int(year) >= 2015:
-        codes_str = ','.join(list(codes) + [x + 'A' for x in codes])
-    else:
-        codes_str = ','.join([
-            x for x in codes if x not in ['DP05_0087E', 'DP05_0082E']] 
-            + [x + 'A' for x in codes if x not in ['DP05_0087E', 'DP05_0082E']
-        ])
+    if int(year) < 2015:
+        return [x for x in codes if x not in ['DP05_0087E', 'DP05_0082E']]
+
+    return list(codes)
+
+
+def _chunk_codes(year, codes):
+    """Returns the codes to request for a year and the chunks of at most
+        MAX_CODES_PER_REQUEST codes they are requested in.
+
+        Raises:
+            ValueError if the API has none of the codes for the year.
+    """
+    codes = available_codes(year, codes)
+    if not codes:
+        raise ValueError(f'No codes to request for {year}. Pass at least one code the API has for that year.')
+
+    chunks = [
+        codes[i:i + MAX_CODES_PER_REQUEST]
+        for i in range(0, len(codes), MAX_CODES_PER_REQUEST)
+    ]
+    return codes, chunks
+
+
+def _finish_table(frames, codes, year):
+    """Joins the frames of each chunk into one table for the year."""
+    df = _join_frames(frames, codes)
+    df['YEAR'] = year
+    return df
+
+
+def decode_acs_stream(chunks, codes):
+    """Decodes an ACS response body into a typed DataFrame as it arrives, one
+        row at a time, so the full text and the list of rows never sit in
+        memory. Values go straight into per-column buffers.
+
+        Args:
+            chunks (iterable): Pieces of the response body as bytes.
+            codes (list): The estimate codes that were requested. Every other
+                column (annotations and geographies) is treated as a category.
+
+        Returns:
+            A DataFrame with the same columns and types as a regular request.
+    """
+    estimates = set(codes)
+    header = None
+    columns = None
+
+    # the body is a list of rows, e.g. [["code","state"],["5.2","01"],...].
+    # None of the values we request contain brackets, so a row is everything
+    # between a '[' and the next ']' once we're inside the outer list.
+    pending = b''
+    in_body = False
+    for chunk in chunks:
+        pending += chunk
+
+        if not in_body:
+            start = pending.find(b'[')
+            if start < 0:
+                continue
+            pending = pending[start + 1:]
+            in_body = True
+
+        pos = 0
+        while True:
+            start = pending.find(b'[', pos)
+            end = pending.find(b']', start + 1) if start >= 0 else -1
+            if end < 0:
+                break
+            row = json.loads(pending[start:end + 1])
+            pos = end + 1
+
+            if header is None:
+                header = row
+                columns = [
+                    _EstimateColumn(name) if name in estimates else _CategoryColumn()
+                    for name in header
+                ]
+            else:
+                for column, value in zip(columns, row):
+                    column.append(value)
+
+        pending = pending[pos:]
+
+    if header is None:
+        raise ValueError('The ACS response did not contain a header row.')
+
+    return pd.DataFrame(
+        {name: column.finish() for name, column in zip(header, columns)},
+        columns=header
+    )
+
+
+class _EstimateColumn:
+    """Buffer for an estimate column that is filled one value at a time."""
+
+    def __init__(self, code):
+        self.code = code
+        self.values = array('d')
+        self.whole = True
+
+    def append(self, value):
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            number = np.nan
+
+        if self.whole and not (
+            isinstance(value, int)
+            or (isinstance(value, str) and value.lstrip('-').isdigit())
+        ):
+            self.whole = False
+
+        self.values.append(number)
+
+    def finish(self):
+        return _cast_estimates(
+            self.code, np.frombuffer(self.values, dtype=np.float64), self.whole
+        )
+
+
+class _CategoryColumn:
+    """Buffer for a categorical column. Values are dictionary encoded as they
+        arrive, and missing values get the code -1. Categories are sorted when
+        the column is finished, the same as pd.Categorical.
+    """
+
+    def __init__(self):
+        self.categories = {}
+        self.codes = array('i')
+
+    def append(self, value):
+        if value is None:
+            self.codes.append(-1)
+            return
+
+        code = self.categories.get(value)
+        if code is None:
+            code = self.categories[value] = len(self.categories)
+        self.codes.append(code)
+
+    def finish(self):
+        categories = list(self.categories)
+        try:
+            order = sorted(range(len(categories)), key=categories.__getitem__)
+        except TypeError:
+            # pd.Categorical leaves values that can't be compared unsorted too
+            order = list(range(len(categories)))
+
+        # the extra last slot maps the missing code -1 to itself
+        remap = np.full(len(categories) + 1, -1, dtype=np.intc)
+        remap[np.asarray(order, dtype=np.intp)] = np.arange(len(categories), dtype=np.intc)
+
+        return pd.Categorical.from_codes(
+            remap[np.frombuffer(self.codes, dtype=np.intc)],
+            categories=[categories[i] for i in order]
+        )
+
+
+def _get_acs_frame(api_key, est, year, geo, geo_val, codes, cache=None,
+    session=None, retries=3, rate_limiter=None, stream=False):
+    """Returns the API response for a set of codes as a typed DataFrame, from
+        the cache if it has one.
+    """
+    if stream:
+        return _get_acs_frame_streaming(
+            api_key, est, year, geo, geo_val, codes, cache=cache,
+            session=session, retries=retries, rate_limiter=rate_limiter
+        )
+
+    payload = cache.get_payload(est, year, geo, geo_val, codes) if cache is not None else None
+
+    if payload is None:
+        payload = _request_acs_data(
+            api_key, est, year, geo, geo_val, codes,
+            session=session, retries=retries, rate_limiter=rate_limiter
+        )
+        if cache is not None:
+            cache.put_payload(est, year, geo, geo_val, codes, payload)
+
+    return _parse_payload(payload, codes)
+
+
+def _get_acs_frame_streaming(api_key, est, year, geo, geo_val, codes,
+    cache=None, session=None, retries=3, rate_limiter=None):
+    """Same as _get_acs_frame, but the body is decoded while it downloads (or
+        while it is decompressed from the cache). When caching, the body is
+        compressed as it streams by instead of being held in full.
+    """
+    content = cache.get_compressed(est, year, geo, geo_val, codes) if cache is not None else None
+
+    if content is not None:
+        return decode_acs_stream(_gunzip_chunks(content), codes)
+
+    # a connection that drops partway through the body is retried from the
+    # start. Failed requests are retried here too rather than in
+    # _request_acs_data, so both share one budget of retries.
+    for attempt in range(retries + 1):
+        try:
+            response = _request_acs_data(
+                api_key, est, year, geo, geo_val, codes,
+                session=session, retries=0, rate_limiter=rate_limiter, stream=True
+            )
+
+            compressor = zlib.compressobj(wbits=31) if cache is not None else None
+            compressed = []
+
+            def body():
+                for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                    if compressor is not None:
+                        compressed.append(compressor.compress(chunk))
+                    yield chunk
+
+            with response:
+                df = decode_acs_stream(body(), codes)
+            break
+        except (requests.ConnectionError, requests.Timeout, ChunkedEncodingError, requests.HTTPError) as e:
+            retryable = (
+                not isinstance(e, requests.HTTPError)
+                or (e.response is not None and e.response.status_code in RETRY_STATUS_CODES)
+            )
+            if not retryable or attempt == retries:
+                raise
+
+        time.sleep(2 ** attempt)
+
+    if compressor is not None:
+        compressed.append(compressor.flush())
+        cache.put_compressed(est, year, geo, geo_val, codes, b''.join(compressed))
+
+    return df
+
+
+def _gunzip_chunks(content):
+    """Decompresses gzipped bytes a piece at a time."""
+    decompressor = zlib.decompressobj(wbits=31)
+    for i in range(0, len(content), STREAM_CHUNK_SIZE):
+        yield decompressor.decompress(content[i:i + STREAM_CHUNK_SIZE])
+    yield decompressor.flush()
+
+
+def _cast_estimates(code, values, whole):
+    """Percent estimates fit in float32. Counts stay int64 when every value is
+        a whole number; medians and columns with missing values are float64.
+    """
+    if code.endswith('PE'):
+        return values.astype(np.float32)
+    elif whole:
+        return values.astype(np.int64)
+
+    return values.astype(np.float64)
+
+
+def _decode_estimates(code, values):
+    """Converts the strings the API returns for an estimate into numbers."""
+    values = pd.to_numeric(np.array(values, dtype=object), errors='coerce')
+    return _cast_estimates(code, values, np.issubdtype(values.dtype, np.integer))
+
+
+def _parse_payload(payload, codes):
+    """Decodes an API response (a header row followed by data rows) column by
+        column into typed arrays. Estimates become numbers, while annotations
+        and geography ids, which only take a handful of values, become
+        categoricals.
+    """
+    header, rows = payload[0], payload[1:]
+    estimates = set(codes)
+
+    data = {}
+    for name, values in zip(header, zip(*rows) if rows else [()] * len(header)):
+        if name in estimates:
+            data[name] = _decode_estimates(name, values)
+        else:
+            data[name] = pd.Categorical(values)
+
+    return pd.DataFrame(data, columns=header)
+
+
+def _join_frames(frames, codes):
+    """Joins the responses for each chunk of codes on the geography columns.
+        Columns come back in the same order a single request would return
+        them: the codes, their annotations and then the geography columns.
+    """
+    if len(frames) == 1:
+        return frames[0]
+
+    annotations = [x + 'A' for x in codes]
+    requested = set(codes) | set(annotations)
+    geo_cols = [c for c in frames[0].columns if c not in requested]
+
+    df = pd.concat([f.set_index(geo_cols) for f in frames], axis=1, copy=False)
+    return df.reset_index()[[*codes, *annotations, *geo_cols]]
+
+
+def _request_acs_data(api_key, est, year, geo, geo_val, codes, session=None,
+    retries=3, rate_limiter=None, stream=False):
+    """Calls the ACS profile API and returns the decoded JSON response, a list
+        of rows where the first row is the header. If stream is True the
+        response is returned unread instead. Transient failures are retried
+        with exponential backoff.
+    """
+    codes_str = ','.join(list(codes) + [x + 'A' for x in codes])
 
     geo_formatted = geo.lower().replace(' ', '%20')
     url = (
@@ -45,14 +478,28 @@ def get_acs_data_table(api_key, est, year, geo, geo_val, *codes):
        .format(year, est, codes_str, geo_formatted, geo_val, api_key)
     )
 
-    response = requests.get(url)
+    http = session if session is not None else requests
 
-    # if the status code is anything but 200 (e.g. a 404 error) then this
-    # function should fail. This may happen if any of the params passed to this
-    # function results in a failed request.
-    assert response.status_code == 200
+    for attempt in range(retries + 1):
+        if rate_limiter is not None:
+            rate_limiter.wait()
 
-    acs_response = response.json()
-    df = pd.DataFrame(acs_response[1:], columns=acs_response[0])
-    df['YEAR'] = year
-    return df
+        try:
+            response = http.get(url, timeout=120, stream=stream)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+        else:
+            if response.status_code == 200:
+                return response if stream else response.json()
+
+            # anything that isn't a transient error (e.g. a 404 from a bad
+            # code or year) won't be fixed by retrying, so fail right away.
+            if response.status_code not in RETRY_STATUS_CODES or attempt == retries:
+                response.raise_for_status()
+                raise requests.HTTPError(
+                    f'Unexpected status code {response.status_code} from the '
+                    f'Census API', response=response
+                )
+
+        time.sleep(2 ** attempt)
@@ -0,0 +1,152 @@
+"""A single file of Arrow tables that is opened with memory mapping, so an app
+    can load many cleaned tables without parsing any text. Each table is an
+    Arrow IPC file stored at an aligned offset, and a json manifest at the end
+    of the file records where each table is. Reading a table only maps its
+    pages; nothing is decoded until it is converted to pandas.
+
+    A table can be indexed by a column when it is written. Its rows are then
+    sorted by that column and the manifest records the rows of each value, so
+    reading one value (e.g. a state's shapes) is a slice.
+
+    Layout:
+        MAGIC
+        one Arrow IPC file per table, each starting on an ALIGNMENT boundary
+        manifest (json)
+        manifest length (8 bytes, little endian), MAGIC
+"""
+import datetime
+import json
+import os
+import struct
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+MAGIC = b'DRBUNDLE'
+ALIGNMENT = 64
+_TRAILER = struct.Struct('<Q')
+
+
+def write_bundle(path, tables, version, metadata=None, indexes=None):
+    """Writes DataFrames to a bundle.
+
+        Args:
+            path (str): File to write. It is replaced atomically.
+            tables (dict): Table name to DataFrame.
+            version (int): Version of the bundle's contents. Readers can ask
+                for a version and refuse anything else.
+            metadata (dict): json serializable values stored in the manifest.
+            indexes (dict): Table name to the column it is indexed by.
+    """
+    indexes = indexes or {}
+    manifest = {
+        'version': version,
+        'created': datetime.datetime.utcnow().isoformat(),
+        'metadata': metadata or {},
+        'tables': {},
+    }
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        for name, df in tables.items():
+            entry = {}
+            if name in indexes:
+                df, entry['index'] = _sort_by(df, indexes[name])
+
+            table = pa.Table.from_pandas(df)
+            sink = pa.BufferOutputStream()
+            with ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            buf = sink.getvalue()
+
+            f.write(b'\0' * (-f.tell() % ALIGNMENT))
+            entry.update(offset=f.tell(), length=buf.size, rows=table.num_rows)
+            f.write(buf)
+            manifest['tables'][name] = entry
+
+        raw = json.dumps(manifest).encode('utf-8')
+        f.write(raw)
+        f.write(_TRAILER.pack(len(raw)) + MAGIC)
+
+    os.replace(tmp_path, path)
+
+
+def _sort_by(df, column):
+    """Sorts rows by column, keeping their order within a value, and returns
+        the sorted DataFrame with each value's [start, stop) rows."""
+    df = df.sort_values(column, kind='mergesort').reset_index(drop=True)
+    values, starts = np.unique(df[column].astype(str).values, return_index=True)
+    stops = np.append(starts[1:], len(df))
+
+    return df, {v: [int(a), int(b)] for v, a, b in zip(values, starts, stops)}
+
+
+class Bundle:
+    """A memory mapped bundle written by write_bundle.
+
+        Args:
+            path (str): File to open.
+            version (int): Version the caller expects. A bundle with any other
+                version raises a ValueError.
+    """
+
+    def __init__(self, path, version=None):
+        self.path = path
+        self._buffer = pa.memory_map(path, 'r').read_buffer()
+
+        size = self._buffer.size
+        tail = len(MAGIC) + _TRAILER.size
+        if (size < len(MAGIC) + tail
+            or self._buffer.slice(0, len(MAGIC)).to_pybytes() != MAGIC
+            or self._buffer.slice(size - len(MAGIC)).to_pybytes() != MAGIC):
+            raise ValueError(f'{path} is not a bundle')
+
+        length, = _TRAILER.unpack(self._buffer.slice(size - tail, _TRAILER.size).to_pybytes())
+        self.manifest = json.loads(
+            self._buffer.slice(size - tail - length, length).to_pybytes()
+        )
+
+        if version is not None and self.version != version:
+            raise ValueError(
+                f'{path} is version {self.version}, expected {version}. Rebuild it.'
+            )
+
+    @property
+    def version(self):
+        return self.manifest['version']
+
+    @property
+    def metadata(self):
+        return self.manifest['metadata']
+
+    @property
+    def tables(self):
+        return list(self.manifest['tables'])
+
+    def keys(self, name):
+        """Returns the values an indexed table can be read by."""
+        return list(self.manifest['tables'][name].get('index', {}))
+
+    def read_table(self, name, key=None):
+        """Returns a table as a pyarrow Table backed by the mapped file.
+
+            Args:
+                name (str): Table to read.
+                key (str): For indexed tables, only read the rows with this
+                    value. A value that isn't in the table returns no rows.
+        """
+        entry = self.manifest['tables'][name]
+        table = ipc.open_file(self._buffer.slice(entry['offset'], entry['length'])).read_all()
+
+        if key is not None:
+            start, stop = entry['index'].get(str(key), (0, 0))
+            table = table.slice(start, stop - start)
+
+        return table
+
+    def read(self, name, key=None):
+        """Returns a table as a DataFrame, see read_table."""
+        return self.read_table(name, key).to_pandas(split_blocks=True)
@@ -0,0 +1,72 @@
+"""Allocates values from one set of geographies to another with a crosswalk,
+    such as the geocorr files from the Missouri Census Data Center (e.g.
+    county to ZCTA, or ZCTA to congressional district). The crosswalk is held
+    as a sparse weight matrix, so allocating every source into every target is
+    one matrix product.
+"""
+import numpy as np
+from scipy import sparse
+
+
+class Crosswalk:
+    """Sparse allocation matrix of target geographies by source geographies.
+
+        Args:
+            crosswalk_df (Pandas DataFrame): One row per (source, target) pair.
+            source_col (str): Column with the source geography, e.g. 'county'
+            target_col (str): Column with the target geography, e.g. 'zcta5'
+            weight_col (str): Column with the share of the source that belongs
+                to the target, e.g. geocorr's 'afact'. Every pair gets a weight
+                of 1 when this is None.
+    """
+
+    def __init__(self, crosswalk_df, source_col, target_col, weight_col=None):
+        df = crosswalk_df.dropna(subset=[source_col, target_col])
+        self.sources, source_code = np.unique(df[source_col].values, return_inverse=True)
+        self.targets, target_code = np.unique(df[target_col].values, return_inverse=True)
+
+        weights = (
+            np.ones(len(df)) if weight_col is None
+            else df[weight_col].values.astype(np.float64)
+        )
+
+        # repeated pairs are summed when the matrix is built
+        self.matrix = sparse.csr_matrix(
+            (weights, (target_code, source_code)),
+            shape=(len(self.targets), len(self.sources))
+        )
+
+    def source_positions(self, source_ids):
+        """Returns the column of the matrix for each source id, and whether the
+            id is in the crosswalk at all."""
+        source_ids = np.asarray(source_ids)
+        if not len(self.sources):
+            return np.zeros(len(source_ids), dtype=np.int64), np.zeros(len(source_ids), dtype=bool)
+
+        positions = np.minimum(np.searchsorted(self.sources, source_ids), len(self.sources) - 1)
+        return positions, self.sources[positions] == source_ids
+
+    def allocate(self, source_ids, values):
+        """Allocates values from sources to targets.
+
+            Args:
+                source_ids (array like): Source geography of each row of
+                    values. Ids can repeat, their values are added up. Ids that
+                    aren't in the crosswalk are dropped.
+                values (array like): A 1d array, or a 2d array with a column
+                    for each quantity to allocate.
+
+            Returns:
+                An array with a row for each of self.targets.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        flat = values.ndim == 1
+        if flat:
+            values = values[:, None]
+
+        positions, found = self.source_positions(source_ids)
+        by_source = np.zeros((len(self.sources), values.shape[1]))
+        np.add.at(by_source, positions[found], values[found])
+
+        allocated = self.matrix @ by_source
+        return allocated[:, 0] if flat else allocated
@@ -0,0 +1,86 @@
+"""Indicators derived from ACS indicators, declared in
+    conf/derived_indicators.yml and computed for every geography and year in
+    one pass, so readers only read columns.
+
+    Each derived indicator has a kind and the column(s) it is computed from:
+        entropy: Shannon entropy of the shares in the columns listed in `of`,
+            divided by `scale` first (100 for percents). Missing and zero
+            shares contribute nothing.
+        complement: `total` minus the column in `of`.
+        percentile: Percentile rank of the column in `of` among geographies in
+            the same year.
+        delta: Change in the column in `of` since `years` (default 1) years
+            before, for the same geography. Missing when that year isn't there.
+
+    A derived indicator can be computed from the ones declared before it.
+"""
+import numpy as np
+import pandas as pd
+import yaml
+
+KINDS = ('entropy', 'complement', 'percentile', 'delta')
+
+
+def read_derived_indicators(path='conf/derived_indicators.yml'):
+    """Reads the derived indicator declarations, in order.
+
+        Returns:
+            A dict of name to declaration.
+    """
+    with open(path, 'r') as f:
+        return yaml.safe_load(f).get('derived') or {}
+
+
+def compute_derived(df, key, derived, year_col='YEAR'):
+    """Computes derived indicators for every row of df.
+
+        Args:
+            df (Pandas DataFrame): Indicators by geography and year, e.g. a
+                view from the ACS warehouse.
+            key (str): Column that identifies a geography, e.g. 'CD'
+            derived (dict): Declarations, see read_derived_indicators.
+            year_col (str): Column that holds the year.
+
+        Returns:
+            A DataFrame row aligned with df, with key, year_col and a column
+            for each derived indicator.
+
+        Raises:
+            ValueError if a declaration has an unknown kind or uses a column
+            that isn't in df or declared before it.
+    """
+    out = df[[key, year_col]].copy()
+    years = df[year_col].values.astype(int)
+    geos = df[key].astype(str).values
+
+    def column(name, used_by):
+        if name in out.columns and name not in (key, year_col):
+            return out[name].values.astype(float)
+        if name in df.columns:
+            return df[name].values.astype(float)
+        raise ValueError(f'{used_by} is derived from {name}, which is not an indicator')
+
+    for name, spec in derived.items():
+        kind = spec.get('kind')
+        if kind == 'entropy':
+            shares = np.column_stack([column(c, name) for c in spec['of']]) / spec.get('scale', 1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                values = -np.nansum(shares * np.log(shares), axis=1)
+        elif kind == 'complement':
+            values = spec.get('total', 100) - column(spec['of'], name)
+        elif kind == 'percentile':
+            values = pd.Series(column(spec['of'], name)).groupby(years).rank(pct=True).values
+        elif kind == 'delta':
+            current = column(spec['of'], name)
+            previous = (
+                pd.Series(current, index=pd.MultiIndex.from_arrays([geos, years]))
+                .reindex(pd.MultiIndex.from_arrays([geos, years - spec.get('years', 1)]))
+                .values
+            )
+            values = current - previous
+        else:
+            raise ValueError(f'{name} has kind {kind}, expected one of {", ".join(KINDS)}')
+
+        out[name] = values
+
+    return out
@@ -1,9 +1,104 @@
 """Uses election data to create certain views such as voting history of 
     district
 """
+import os
+
 import numpy as np
 import pandas as pd
 
+from ..cache import read_cached_frame
+
+# files each race's historical general election results are built from
+ELECTION_SOURCES = {
+    'house': ('1976-2018-house3.csv', '2020-house-full.csv'),
+    'senate': ('1976-2020-senate.csv',),
+    'president': ('1976-2020-president.csv',),
+}
+
+# Daily Kos files of presidential results by congressional district, keyed by
+# the election the district lines were used in. Each file has (D, R) column
+# pairs for the years listed, newest first.
+DAILY_KOS_SOURCES = {
+    2014: {
+        'file': 'Daily Kos Elections 2008 & 2012 presidential election results for congressional districts used in 2012 & 2014 elections - Results.csv',
+        'header': 0,
+        'years': [2012, 2008],
+    },
+    2016: {
+        'file': 'Daily Kos Elections 2008, 2012 & 2016 presidential election results for congressional districts used in 2016 elections - Results.csv',
+        'header': 1,
+        'years': [2016, 2012, 2008],
+    },
+    2018: {
+        'file': 'Daily Kos Elections 2008, 2012 & 2016 presidential election results for congressional districts used in 2018 elections - Results.csv',
+        'header': 1,
+        'years': [2016, 2012, 2008],
+    },
+    2020: {
+        'file': 'Daily Kos Elections 2012, 2016 & 2020 presidential election results for congressional districts used in 2020 elections - Results.csv',
+        'header': 1,
+        'years': [2020, 2016, 2012],
+    },
+}
+
+# the only columns we use from each race's files. The senate and president
+# files call the party column party_detailed.
+ELECTION_COLUMNS = {
+    'house': ['year', 'state_po', 'district', 'party', 'candidatevotes', 'stage'],
+    'senate': ['year', 'state_po', 'party_detailed', 'candidatevotes', 'stage'],
+    'president': ['year', 'state_po', 'party_detailed', 'candidatevotes'],
+}
+
+
+def read_general_election_df(election_type, data_dir='data',
+    cache_dir='data/cache/elections'):
+    """Reads historical general election results for a race. House results
+        combine the MIT data with our 2020 results.
+
+        Only the columns we use are parsed and they are stored compactly:
+        categoricals for state_po, party and stage, small ints for year and
+        district and int32 for votes. The result is cached as a feather file
+        keyed on the hash of the source csvs, so after the first call this is
+        a memory mapped read.
+
+        Args:
+            election_type (str): Either 'house', 'senate' or 'president'.
+            data_dir (str): Directory the source csvs are in.
+            cache_dir (str): Directory for the cached feather files.
+
+        Returns:
+            A DataFrame of historical general election results.
+    """
+    sources = [os.path.join(data_dir, f) for f in ELECTION_SOURCES[election_type]]
+    return read_cached_frame(
+        cache_dir, election_type, sources,
+        lambda: _read_election_csvs(sources, ELECTION_COLUMNS[election_type])
+    )
+
+
+def _read_election_csvs(sources, columns):
+    df = pd.concat([
+        pd.read_csv(path, usecols=columns)
+        for path in sources
+    ], ignore_index=True).rename(columns={'party_detailed': 'party'})
+
+    df['year'] = df['year'].astype(np.int16)
+    # a handful of rows have no vote count, they don't add to any totals
+    df['candidatevotes'] = df['candidatevotes'].fillna(0).astype(np.int32)
+    for c in ['state_po', 'party', 'stage']:
+        if c in df.columns:
+            df[c] = df[c].astype('category')
+
+    # at-large districts are 0 in the MIT data, we call them 01.
+    if 'district' in df.columns:
+        df['district'] = df['district'].replace(0, 1).astype(np.int8)
+
+    return df[[
+        c for c in ['year', 'state_po', 'district', 'party', 'candidatevotes', 'stage']
+        if c in df.columns
+    ]]
+
+
 def get_general_election_results(df, start, stop, area, is_district):
     """Grabs general election results from a dataset that aheres to the MIT
     Election Lab dataset schemas.
@@ -13,8 +108,10 @@ def get_general_election_results(df, start, stop, area, is_district):
             data
             start (int): Beginning of the time window that data is collected for
             stop (int): End of the time window that data is collected for.
-            area (str): The identifier to filter on. E.g. could be a state
-            abbreviation like 'AK' or a district like 'NY-03'
+            area (str or list): The identifier to filter on. E.g. could be a
+            state abbreviation like 'AK' or a district like 'NY-03'. A list of
+            identifiers returns all of them in one pass, and '*' returns every
+            area.
             is_district (bool): Defines whether this is a district query or a
             state query. If its district there is slightly different logic to
             create the final view.
@@ -24,6 +121,94 @@ def get_general_election_results(df, start, stop, area, is_district):
     """
 
     subset = df[(df['year'] >= start) & (df['year'] <= stop)]
+    subset, filter_col = _normalize_general_election_results(subset, is_district)
+
+    # star is used to calculate PVI. We will capture all votes across states.
+    if isinstance(area, (list, tuple, set)):
+        return (
+            subset[['year', filter_col, 'party', 'candidatevotes']]
+            [subset[filter_col].isin(area)]
+        )
+    elif area != '*':
+        return (
+            subset[['year', filter_col, 'party', 'candidatevotes']]
+            [subset[filter_col] == area]
+        )
+    else:
+        return subset[['year', filter_col, 'party', 'candidatevotes']]
+
+
+class GeneralElectionIndex:
+    """General election results that have been normalized and ranked once, then
+        split up by area (district or state). Looking up an area is a dictionary
+        lookup followed by a filter on a handful of rows, and returns exactly
+        what get_general_election_results returns for that area.
+
+        Args:
+            df (Pandas DataFrame): A DataFrame that contains election returns
+            data, following the MIT Election Lab schema.
+            is_district (bool): Whether to index by congressional district
+            (e.g. 'NY-03') or by state (e.g. 'NY').
+    """
+
+    def __init__(self, df, is_district):
+        subset, filter_col = _normalize_general_election_results(df.copy(), is_district)
+        self._index(subset[['year', filter_col, 'party', 'candidatevotes']], is_district)
+
+    @classmethod
+    def from_results(cls, results, is_district):
+        """Rebuilds an index from the results of another one (e.g. read back
+            from a bundle) without normalizing them again."""
+        index = cls.__new__(cls)
+        index._index(results, is_district)
+        return index
+
+    def _index(self, subset, is_district):
+        filter_col = 'CD' if is_district else 'state_po'
+
+        self.is_district = is_district
+        self.filter_col = filter_col
+        self.results = subset
+
+        # groupby keeps the original row order and index within each area, so
+        # lookups line up with get_general_election_results row for row.
+        self.areas = {
+            area: (group, group['year'].values)
+            for area, group in subset.groupby(filter_col, sort=False, observed=True)
+        }
+        self._empty = subset.iloc[:0]
+
+    def get_results(self, start, stop, area):
+        """Grabs the results for an area between start and stop. Takes the same
+            arguments as get_general_election_results: area can be a list of
+            areas, and '*' returns every area.
+        """
+        if isinstance(area, (list, tuple, set)):
+            groups = [self.areas[a][0] for a in area if a in self.areas]
+            if not groups:
+                return self._empty
+            group = pd.concat(groups)
+            years = group['year'].values
+        elif area == '*':
+            group, years = self.results, self.results['year'].values
+        elif area in self.areas:
+            group, years = self.areas[area]
+        else:
+            return self._empty
+
+        return group[(years >= start) & (years <= stop)]
+
+
+def _normalize_general_election_results(subset, is_district):
+    """Applies the party normalization and ranking used by
+        get_general_election_results to every row of subset. Ranks are
+        computed within a year, so the result does not depend on the window
+        of years passed in.
+
+        Returns:
+            The normalized DataFrame and the name of the column that holds the
+            area (CD or state_po).
+    """
 
     # Democrats are named different things in two states, ND and MN.
     subset['party'] = (
@@ -76,7 +261,7 @@ def get_general_election_results(df, start, stop, area, is_district):
     if is_district:
         filter_col = 'CD'
         subset[filter_col] = (
-            subset['state_po']
+            subset['state_po'].astype(str)
             + '-'
             + subset['district'].astype(str)
                 .str.pad(2, 'left', '0')
@@ -87,15 +272,75 @@ def get_general_election_results(df, start, stop, area, is_district):
         # don't include any secondary democrats or republicans in non-house races
         # these may be write ins. 
         subset = subset[~subset['party'].str.match('(?:DEMOCRAT|REPUBLICAN) \(\d\)')]
-    
-    # star is used to calculate PVI. We will capture all votes across states.
-    if area != '*':
-        return (
-            subset[['year', filter_col, 'party', 'candidatevotes']]
-            [subset[filter_col] == area]
-        )
-    else:
-        return subset[['year', filter_col, 'party', 'candidatevotes']]
+
+    return subset, filter_col
+
+
+def read_daily_kos(lines=None, data_dir='data', cache_dir='data/cache/elections'):
+    """Reads Daily Kos presidential results by congressional district for one
+        or more sets of district lines into one long table. The combined table
+        is cached as a feather file keyed on the hash of the source csvs.
+
+        Args:
+            lines (list): District line vintages to read, e.g. [2020]. See
+                DAILY_KOS_SOURCES. Defaults to all of them.
+            data_dir (str): Directory the source csvs are in.
+            cache_dir (str): Directory for the cached feather files.
+
+        Returns:
+            A DataFrame with columns LINES (the election the district lines
+            were used in), CD, YEAR, PARTY (DEMOCRAT, REPUBLICAN or OTHER) and
+            PCT.
+    """
+    lines = sorted(DAILY_KOS_SOURCES) if lines is None else sorted(lines)
+    sources = [os.path.join(data_dir, DAILY_KOS_SOURCES[l]['file']) for l in lines]
+
+    def build():
+        return pd.concat([
+            reshape_daily_kos(
+                pd.read_csv(path, header=DAILY_KOS_SOURCES[l]['header']),
+                l, DAILY_KOS_SOURCES[l]['years']
+            )
+            for l, path in zip(lines, sources)
+        ], ignore_index=True)
+
+    return read_cached_frame(
+        cache_dir, 'daily-kos-' + '-'.join(str(l) for l in lines), sources, build
+    )
+
+
+def reshape_daily_kos(df, lines, years):
+    """Reshapes one Daily Kos file into the long format read_daily_kos returns.
+        Every file has the district, the incumbent and their party followed by
+        a (Democrat, Republican) pair of percentages for each year, so the
+        values are reshaped as one block instead of melting and pivoting.
+
+        Rows come out ordered by year, then party, then district, in the order
+        they appear in the file.
+
+        Args:
+            df (Pandas DataFrame): A Daily Kos file as read from csv.
+            lines (int): The election the file's district lines were used in.
+            years (list): The years of the (D, R) column pairs, in file order.
+
+        Returns:
+            A DataFrame with columns LINES, CD, YEAR, PARTY and PCT.
+    """
+    df = df[pd.notnull(df.iloc[:, 0])]
+    n_rows, n_years = len(df), len(years)
+
+    cds = df.iloc[:, 0].str.replace('-AL', '-01').values
+    pct = df.iloc[:, 3:3 + 2 * n_years].to_numpy(dtype=np.float64).reshape(n_rows, n_years, 2)
+    pct = np.concatenate([pct, 100 - pct.sum(axis=2, keepdims=True)], axis=2)
+
+    parties = ['DEMOCRAT', 'REPUBLICAN', 'OTHER']
+    return pd.DataFrame({
+        'LINES': np.full(n_rows * n_years * 3, lines, dtype=np.int16),
+        'CD': pd.Categorical(np.tile(cds, n_years * 3)),
+        'YEAR': np.repeat(np.array(years, dtype=np.int16), 3 * n_rows),
+        'PARTY': pd.Categorical(np.tile(np.repeat(parties, n_rows), n_years), categories=parties),
+        'PCT': pct.transpose(1, 2, 0).ravel(),
+    })
 
 
 def clean_daily_kos2020(df):
@@ -109,21 +354,7 @@ def clean_daily_kos2020(df):
         Returns:
             A cleaned pandas dataframe with election results.
     """
-    df_copy = df.iloc[:, :9]
-    df_copy.columns = ["district", "incumbent", "party", "dem_2020", "rep_2020", 
-                    "dem_2016", "rep_2016", "dem_2012", "rep_2012"]
-    df_copy = df_copy.drop(['incumbent', 'party'], axis=1)
-
-    df_copy = df_copy.melt(
-        id_vars='district', 
-        value_vars = ['dem_2020', 'rep_2020', 'dem_2016', 'rep_2016', 'dem_2012', 'rep_2012']
+    return (
+        reshape_daily_kos(df, 2020, DAILY_KOS_SOURCES[2020]['years'])
+        [['YEAR', 'CD', 'PARTY', 'PCT']]
     )
-
-    df_copy[["party", "year"]] = pd.DataFrame(df_copy["variable"].str.split("_").values.tolist())
-    df_copy = df_copy.pivot_table(index = ["year", 'district'], columns = "party", values = "value").reset_index()
-    df_copy["other"] = 100 - df_copy["dem"] - df_copy["rep"]
-    df_copy.columns = ['YEAR', 'CD', 'DEMOCRAT', 'REPUBLICAN', 'OTHER']
-    df_copy['CD'] = df_copy['CD'].str.replace('-AL', '-01')
-    df_copy = df_copy.melt(id_vars = ['YEAR', 'CD'], var_name='PARTY', value_name='PCT')
-
-    return df_copy
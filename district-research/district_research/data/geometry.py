@@ -0,0 +1,143 @@
+"""A store of ZCTA geometries simplified ahead of time at a few tolerances, so
+    maps don't read the full resolution national shapefile. Geometries are
+    stored as GeoParquet, one file per state, with bounding box columns next to
+    the geometry. Readers open only the states they need, only the columns they
+    need, and skip rows outside a bounding box before decoding any geometry.
+
+    Layout:
+        {root}/tolerance={tolerance}/state={state}/part.parquet
+"""
+import json
+import os
+
+import geopandas as gpd
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# simplification tolerances in degrees. 0.001 is about 100 meters, which can't
+# be seen at the zoom level of a district map.
+TOLERANCES = (0.0005, 0.001, 0.005)
+DEFAULT_TOLERANCE = 0.001
+
+BBOX_COLUMNS = ['minx', 'miny', 'maxx', 'maxy']
+
+
+class GeometryStore:
+    """Builds and reads simplified geometries.
+
+        Args:
+            root (str): Directory the store lives in.
+    """
+
+    def __init__(self, root='data/warehouse/geometry'):
+        self.root = root
+
+    def _tolerance_dir(self, tolerance):
+        return os.path.join(self.root, f'tolerance={tolerance}')
+
+    def partition_path(self, tolerance, state):
+        return os.path.join(self._tolerance_dir(tolerance), f'state={state}', 'part.parquet')
+
+    def states(self, tolerance=DEFAULT_TOLERANCE):
+        """Returns the states stored at a tolerance."""
+        tolerance_dir = self._tolerance_dir(tolerance)
+        if not os.path.isdir(tolerance_dir):
+            return []
+
+        return sorted(
+            d.split('=')[1] for d in os.listdir(tolerance_dir)
+            if d.startswith('state=')
+            and os.path.exists(os.path.join(tolerance_dir, d, 'part.parquet'))
+        )
+
+    def build(self, shape_df, states_df, key='ZCTA5', tolerances=TOLERANCES):
+        """Simplifies geometries at each tolerance and writes them by state.
+
+            Args:
+                shape_df (Geopandas DataFrame): Full resolution shapes with a
+                    key column, e.g. the tl_2019_us_zcta510 shapefile.
+                states_df (Pandas DataFrame): key and STUSAB columns. A shape in
+                    more than one state is written to each of them.
+                key (str): Column that identifies a shape.
+                tolerances (list): Tolerances to write.
+        """
+        shapes = (
+            shape_df[[key, 'geometry']]
+            .merge(states_df[[key, 'STUSAB']].drop_duplicates(), how='inner', on=key)
+        )
+
+        for tolerance in tolerances:
+            simplified = gpd.GeoDataFrame(
+                shapes[[key, 'STUSAB']],
+                geometry=shapes.geometry.simplify(tolerance, preserve_topology=True),
+                crs=shape_df.crs
+            )
+            bounds = simplified.geometry.bounds
+            for c in BBOX_COLUMNS:
+                simplified[c] = bounds[c].values
+
+            for state, group in simplified.groupby('STUSAB'):
+                path = self.partition_path(tolerance, state)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+
+                # write then swap so a reader never sees half a partition
+                tmp_path = f'{path}.{os.getpid()}.tmp'
+                group.drop('STUSAB', axis=1).reset_index(drop=True).to_parquet(tmp_path, index=False)
+                os.replace(tmp_path, path)
+
+    def read(self, states=None, bbox=None, columns=None, tolerance=DEFAULT_TOLERANCE):
+        """Reads simplified geometries.
+
+            Args:
+                states (list): States to read, defaults to every state.
+                bbox (tuple): Optional (minx, miny, maxx, maxy). Only shapes
+                    that intersect it are decoded.
+                columns (list): Columns to read besides geometry, defaults to
+                    the key.
+                tolerance (float): One of the tolerances the store was built
+                    with.
+
+            Returns:
+                A GeoDataFrame with the columns asked for and geometry.
+        """
+        states = self.states(tolerance) if states is None else states
+        frames = []
+        crs = None
+        for state in states:
+            path = self.partition_path(tolerance, state)
+            if not os.path.exists(path):
+                continue
+
+            schema = pq.read_schema(path)
+            read_columns = columns if columns is not None else [
+                c for c in schema.names if c not in BBOX_COLUMNS and c != 'geometry'
+            ]
+            table = pq.read_table(path, columns=[*read_columns, 'geometry', *BBOX_COLUMNS])
+
+            if bbox is not None:
+                minx, miny, maxx, maxy = (table.column(c).to_numpy() for c in BBOX_COLUMNS)
+                table = table.filter(pa.array(
+                    (minx <= bbox[2]) & (maxx >= bbox[0]) & (miny <= bbox[3]) & (maxy >= bbox[1])
+                ))
+
+            df = table.drop(BBOX_COLUMNS).to_pandas()
+            df['geometry'] = gpd.GeoSeries.from_wkb(df['geometry'].values)
+            frames.append(df)
+
+            if crs is None:
+                crs = _parquet_crs(schema)
+
+        if not frames:
+            return gpd.GeoDataFrame(columns=[*(columns or []), 'geometry'], geometry='geometry', crs=crs)
+
+        return gpd.GeoDataFrame(pd.concat(frames, ignore_index=True), geometry='geometry', crs=crs)
+
+
+def _parquet_crs(schema):
+    """Reads the CRS geopandas saves in the GeoParquet metadata."""
+    metadata = (schema.metadata or {}).get(b'geo')
+    if metadata is None:
+        return None
+
+    return json.loads(metadata)['columns']['geometry'].get('crs')
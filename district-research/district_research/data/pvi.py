@@ -3,95 +3,489 @@
 import numpy as np
 import pandas as pd
 
-def calculate_pvi(general_election_df, level_col):
+from .elections import get_general_election_results
+
+PARTIES = ('DEMOCRAT', 'REPUBLICAN')
+
+
+def calculate_pvi(general_election_df, level_col, formatted=True):
     """Takes a dataframe of general election results from MIT and calculates
-    PVI."""
-    
-    # step 1: clean data, make sure we have total counts for each county.
-    # some results are broken up into early voting, election day, etc.
-    count_df = (
-        general_election_df
-        [general_election_df['party'].isin(['DEMOCRAT', 'REPUBLICAN'])]
-        .groupby(['year', level_col, 'candidate', 'party'])
-        .sum()['candidatevotes']
-        .reset_index()
-    )
+    PVI for every geography in level_col and every year after the first.
 
-    # step 2: make number of votes into percentage
-    count_df['total'] = (
-        count_df
-        .groupby(['year', level_col])
-        .transform('sum')['candidatevotes']
+    Everything is computed in one pass over the results sorted by integer coded
+    (year, geography, candidate, party) keys, instead of a chain of groupby,
+    merge and sort calls.
+
+    Args:
+        general_election_df (Pandas DataFrame): Results with year, level_col,
+            candidate, party and candidatevotes columns.
+        level_col (str): Column with the geography, e.g. 'county_fips'.
+        formatted (bool): Return PVI as strings like 'R+5' (see format_pvi)
+            instead of signed numbers.
+
+    Returns:
+        A DataFrame with year, level_col, candidate, party and pvi for the
+        winner in each geography and year. As a number, PVI is positive for
+        republican leaning places and negative for democratic ones.
+    """
+    return pvi_from_aggregates(
+        aggregate_returns(general_election_df, level_col), level_col,
+        formatted=formatted
     )
-    count_df['candidatepct'] = count_df['candidatevotes']/count_df['total']
 
-    # step 3: get percent at election-wide level per party
-    count_df['total_election_per_party'] = (
-        count_df
-        .groupby(['year', 'party'])
-        .transform('sum')['candidatevotes']
+
+def aggregate_returns(general_election_df, level_col):
+    """Sums election returns into the per-year aggregates PVI is calculated
+        from. Each year's aggregates only depend on that year's returns.
+
+        Args:
+            general_election_df (Pandas DataFrame): Results with year,
+                level_col, candidate, party and candidatevotes columns.
+            level_col (str): Column with the geography, e.g. 'county_fips'.
+
+        Returns:
+            A DataFrame with one row per (year, geography, candidate, party)
+            for the two major parties, sorted by those keys, with the votes,
+            the candidate's two party share in the geography (candidatepct)
+            and the party's two party share in the whole election
+            (electionpct).
+    """
+    df = general_election_df[
+        general_election_df['party'].isin(PARTIES)
+    ].dropna(subset=['year', level_col, 'candidate'])
+
+    # step 1: integer code the keys. Codes follow the sorted values so rows come
+    # out in the same order a sorted groupby would give.
+    years, year_code = np.unique(df['year'].values, return_inverse=True)
+    levels, level_code = np.unique(df[level_col].values, return_inverse=True)
+    candidates, candidate_code = np.unique(
+        df['candidate'].values.astype(str), return_inverse=True
     )
+    party_code = (df['party'].values == PARTIES[1]).astype(np.int64)
+    votes = df['candidatevotes'].fillna(0).values.astype(np.float64)
+
+    # step 2: total counts for each candidate. Some results are broken up into
+    # early voting, election day, etc.
+    order = np.lexsort((party_code, candidate_code, level_code, year_code))
+    keys = [a[order] for a in (year_code, level_code, candidate_code, party_code)]
+    starts = np.flatnonzero(_key_changes(*keys))
+    votes = np.add.reduceat(votes[order], starts)
+    year_code, level_code, candidate_code, party_code = (k[starts] for k in keys)
+
+    # step 3: make number of votes into percentages, in the geography and at
+    # the election-wide level per party
+    area = np.cumsum(_key_changes(year_code, level_code)) - 1
+    party_votes = np.bincount(
+        year_code * 2 + party_code, weights=votes, minlength=2 * len(years)
+    ).reshape(-1, 2)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        candidate_pct = votes / np.bincount(area, weights=votes)[area]
+        election_pct = (party_votes / party_votes.sum(axis=1, keepdims=True))[year_code, party_code]
+
+    return pd.DataFrame({
+        'year': years[year_code],
+        level_col: levels[level_code],
+        'candidate': candidates[candidate_code].astype(object),
+        'party': np.where(party_code == 1, PARTIES[1], PARTIES[0]).astype(object),
+        'candidatevotes': votes,
+        'candidatepct': candidate_pct,
+        'electionpct': election_pct,
+    })
+
+
+def pvi_from_aggregates(aggregates_df, level_col, first_year=None, formatted=True):
+    """Calculates PVI from the aggregates aggregate_returns makes. Aggregates
+        from several calls can be stacked, as long as they stay sorted by year.
+
+        Args:
+            aggregates_df (Pandas DataFrame): Output of aggregate_returns.
+            level_col (str): Column with the geography.
+            first_year (int): Years up to and including this one are only used
+                as the previous election. Defaults to the earliest year.
+            formatted (bool): Return PVI as strings instead of signed numbers.
+
+        Returns:
+            The same DataFrame calculate_pvi returns.
+    """
+    year_values = aggregates_df['year'].values.astype(np.int64)
+    _, level_code = np.unique(aggregates_df[level_col].values, return_inverse=True)
+    party_code = (aggregates_df['party'].values == PARTIES[1]).astype(np.int64)
+    votes = aggregates_df['candidatevotes'].values
+    candidate_pct = aggregates_df['candidatepct'].values
+    election_pct = aggregates_df['electionpct'].values
+    area = np.cumsum(_key_changes(year_values, level_code)) - 1
+
+    # step 4: get the results for the same party and geography from the
+    # previous election. This assumes one candidate per party.
+    n_levels = level_code.max() + 1 if len(level_code) else 0
+    key = (year_values * 2 + party_code) * n_levels + level_code
+    previous_key = ((year_values - 4) * 2 + party_code) * n_levels + level_code
+
+    previous, found = _lookup(key, previous_key)
+    previous_candidate_pct = np.where(found, candidate_pct[previous], np.nan)
+    previous_election_pct = np.where(found, election_pct[previous], np.nan)
+
+    # step 5: choose the winner in each geography. We can't calculate pvi for
+    # the first year because we have no data from before then.
+    if first_year is None:
+        first_year = year_values.min()
+    by_votes = np.lexsort((-votes, area))
+    winners = np.sort(by_votes[_key_changes(area[by_votes])])
+    winners = winners[year_values[winners] > first_year]
+
+    # step 6: calculate pvi by getting average results of candidate from the
+    # geography vs. average results from candidate from entire election.
+    diff_in_avgs = (
+        _nanmean2(candidate_pct[winners], previous_candidate_pct[winners])
+        - _nanmean2(election_pct[winners], previous_election_pct[winners])
+    ) * 100
+    diff_in_avgs = np.where(np.isnan(diff_in_avgs), 0, diff_in_avgs)
+
+    is_republican = party_code[winners] == 1
+    pvi_df = pd.DataFrame({
+        'year': aggregates_df['year'].values[winners],
+        level_col: aggregates_df[level_col].values[winners],
+        'candidate': aggregates_df['candidate'].values[winners],
+        'party': aggregates_df['party'].values[winners],
+        'pvi': np.where(is_republican, diff_in_avgs, -diff_in_avgs),
+    })
+
+    if formatted:
+        pvi_df['pvi'] = format_pvi(pvi_df['pvi'], pvi_df['party'])
+
+    return pvi_df
+
+
+def calculate_crosswalk_pvi(general_election_df, level_col, crosswalk,
+    target_col='target', formatted=True):
+    """Calculates PVI for a geography that has no published returns, e.g. ZCTAs
+        or a new district plan, by allocating source level returns (e.g.
+        counties) through a crosswalk. Votes for every (year, party) are moved
+        to every target in one sparse matrix product. National shares still
+        come from the source returns.
+
+        Args:
+            general_election_df (Pandas DataFrame): Source level results, as
+                calculate_pvi takes them.
+            level_col (str): Column with the source geography. Its values must
+                match the crosswalk's sources.
+            crosswalk (Crosswalk): Allocation from sources to targets.
+            target_col (str): Name for the target geography column.
+            formatted (bool): Return PVI as strings instead of signed numbers.
 
-    count_df['total_election'] = (
-        count_df
-        .groupby(['year'])
-        .transform('sum')['candidatevotes']
+        Returns:
+            The same DataFrame calculate_pvi returns, with target_col in place
+            of level_col.
+    """
+    source = aggregate_returns(general_election_df, level_col)
+    party_code = (source['party'].values == PARTIES[1]).astype(np.int64)
+
+    # one column of votes for each (year, party)
+    column_keys, column = np.unique(
+        source['year'].values.astype(np.int64) * 2 + party_code, return_inverse=True
     )
+    votes = np.zeros((len(source), len(column_keys)))
+    votes[np.arange(len(source)), column] = source['candidatevotes'].values
+    target_votes = crosswalk.allocate(source[level_col].values, votes)
 
-    count_df['electionpct'] = count_df['total_election_per_party']/count_df['total_election']
-    
-    # step 4: get the results for the party in question from the previous
-    # election
-    count_df['previous_year'] = count_df['year'] - 4
-    count_df2 = (
-        count_df
-        .merge(count_df[
-            ['year', 'party', level_col, 'candidatepct', 'electionpct']
-        ].rename(
-            columns={
-                'year': 'previous_year',
-                'candidatepct': 'previous_candidatepct',
-                'electionpct': 'previous_electionpct'
-            }),
-        how='left', left_on=['previous_year', 'party', level_col],
-        right_on=['previous_year', 'party', level_col])
+    # the candidate with the most votes labels each (year, party), and the
+    # national share is the same for every row of it
+    by_votes = np.lexsort((-source['candidatevotes'].values, column))
+    first = by_votes[_key_changes(column[by_votes])]
+    candidates = source['candidate'].values[first]
+    election_pct = source['electionpct'].values[first]
+
+    # one row per (year, target, party), sorted the way aggregate_returns sorts
+    n_targets, n_columns = target_votes.shape
+    target = np.repeat(np.arange(n_targets), n_columns)
+    column = np.tile(np.arange(n_columns), n_targets)
+    year = column_keys[column] // 2
+    order = np.lexsort((column, target, year))
+    target, column, year = target[order], column[order], year[order]
+    votes = target_votes[target, column]
+
+    # targets that got no votes in a year have no result for it
+    area = np.cumsum(_key_changes(year, target)) - 1
+    area_votes = np.bincount(area, weights=votes)[area]
+    keep = area_votes > 0
+
+    target_df = pd.DataFrame({
+        'year': year[keep],
+        target_col: crosswalk.targets[target[keep]],
+        'candidate': candidates[column[keep]],
+        'party': np.where(column_keys[column[keep]] % 2 == 1, PARTIES[1], PARTIES[0]).astype(object),
+        'candidatevotes': votes[keep],
+        'candidatepct': votes[keep] / area_votes[keep],
+        'electionpct': election_pct[column[keep]],
+    })
+
+    return pvi_from_aggregates(target_df, target_col, formatted=formatted)
+
+
+def calculate_district_pvi(pres_cd_df, national_shares_df, years_by_lines):
+    """Calculates PVI for congressional districts from Daily Kos presidential
+        results, for every set of district lines at once. For each (lines,
+        district) the winner of each year is compared to the same party four
+        years before, relative to the national two party share.
+
+        Args:
+            pres_cd_df (Pandas DataFrame): Daily Kos results in the long format
+                read_daily_kos returns, with any number of vintages stacked.
+            national_shares_df (Pandas DataFrame): National shares as
+                national_party_shares returns them (year, party ('D' or 'R')
+                and nat_party_share).
+            years_by_lines (dict): Presidential years to use for each set of
+                district lines, e.g. {2020: [2020, 2016]}.
+
+        Returns:
+            A DataFrame with LINES, CD, YEAR and pvi for every district and
+            year that has results from four years before. Negative PVI is
+            democratic and positive is republican, rounded to whole numbers.
+    """
+    use = pres_cd_df['PARTY'].isin(PARTIES) & np.any([
+        (pres_cd_df['LINES'] == lines) & pres_cd_df['YEAR'].isin(years)
+        for lines, years in years_by_lines.items()
+    ], axis=0)
+    df = pres_cd_df[use]
+
+    lines = df['LINES'].values.astype(np.int64)
+    cds, cd_code = np.unique(df['CD'].astype(str).values, return_inverse=True)
+    year = df['YEAR'].values.astype(np.int64)
+    party_code = (df['PARTY'].values == PARTIES[1]).astype(np.int64)
+    share = df['PCT'].values.astype(np.float64)
+
+    # the winner in each (lines, district, year) has the highest share. Ties go
+    # to the first row, and missing shares never win.
+    district = (lines * len(cds) + cd_code) * 10000
+    race = district + year
+    by_share = np.lexsort((-np.where(np.isnan(share), -np.inf, share), race))
+    winners = np.sort(by_share[_key_changes(race[by_share])])
+
+    # the winning party's share in the same district four years before
+    key = (district + year) * 2 + party_code
+    previous, found = _lookup(key, key[winners] - 8)
+    winners, previous = winners[found], previous[found]
+
+    # national share for the winning party in both years
+    nat_key = (
+        national_shares_df['year'].values.astype(np.int64) * 2
+        + (national_shares_df['party'].values == PARTIES[1][0])
     )
+    nat_share = national_shares_df['nat_party_share'].values * 100
+    current_nat, current_found = _lookup(nat_key, year[winners] * 2 + party_code[winners])
+    previous_nat, previous_found = _lookup(nat_key, (year[winners] - 4) * 2 + party_code[winners])
+    keep = current_found & previous_found
+    winners = winners[keep]
+
+    district_avg = _nanmean2(share[winners], share[previous[keep]])
+    national_avg = _nanmean2(nat_share[current_nat[keep]], nat_share[previous_nat[keep]])
+    pvi_raw = district_avg - national_avg
+
+    return pd.DataFrame({
+        'LINES': lines[winners],
+        'CD': cds[cd_code[winners]].astype(object),
+        'YEAR': year[winners],
+        'pvi': np.around(np.where(party_code[winners] == 0, pvi_raw * -1, pvi_raw)),
+    })
+
+
+class SwingSimulator:
+    """Applies national swings to every district's presidential two party share
+        at once. District shares are turned into arrays once, so a simulation
+        is a handful of array operations and is fast enough for a slider.
+
+        Swings are in points of the democratic two party share, positive toward
+        democrats.
+
+        Args:
+            pres_cd_df (Pandas DataFrame): Daily Kos results in the long format
+                read_daily_kos returns.
+            lines (int): Set of district lines to use.
+            year (int): Presidential year the swing is applied to.
+            national_shares_df (Pandas DataFrame): National two party shares
+                as party_shares returns them. The national democratic share
+                anchors proportional swings and PVI. Daily Kos only has
+                percentages, so without it the share is the mean of district
+                shares, which weights every district the same regardless of
+                turnout.
+    """
+
+    METHODS = ('uniform', 'proportional')
+
+    def __init__(self, pres_cd_df, lines=2020, year=2020, national_shares_df=None):
+        df = pres_cd_df[(pres_cd_df['LINES'] == lines) & (pres_cd_df['YEAR'] == year)]
+        share = df.pivot(index='CD', columns='PARTY', values='PCT')
+        share.index = share.index.astype(str)
+
+        self.districts = share.index.values
+        self.states, self.state_code = np.unique(
+            share.index.str.slice(stop=2).values, return_inverse=True
+        )
+        dem = share['DEMOCRAT'].values.astype(np.float64)
+        rep = share['REPUBLICAN'].values.astype(np.float64)
+        self.dem_share = dem / (dem + rep)
+
+        if national_shares_df is None:
+            self.national_dem_share = np.nanmean(self.dem_share)
+        else:
+            nat = national_shares_df[
+                (national_shares_df['year'] == year) & (national_shares_df['party'] == 'D')
+            ]
+            if not len(nat):
+                raise ValueError(f'no national democratic share for {year}')
+            self.national_dem_share = float(nat['nat_party_share'].iloc[0])
+
+    def simulate(self, swing=0.0, method='uniform', state_swings=None):
+        """Simulates a national swing.
+
+            Args:
+                swing (float): Points of democratic two party share to move
+                    every district by, e.g. -2.5 for 2.5 points toward
+                    republicans.
+                method (str): 'uniform' moves every district by the same number
+                    of points. 'proportional' takes votes from the party losing
+                    ground in proportion to its share in each district.
+                state_swings (dict): Extra points for some states, e.g.
+                    {'GA': 1.5}, added on top of the national swing.
+
+            Returns:
+                A DataFrame with a row per district: CD, STATE, the new
+                dem_share, dem_margin (democratic minus republican points),
+                flipped (whether the winner changed), pvi (positive is
+                republican) and pvi_pct (percentile of pvi).
+        """
+        if method not in self.METHODS:
+            raise ValueError(f'method must be one of {self.METHODS}, got {method}')
+
+        points = np.full(len(self.states), swing, dtype=np.float64)
+        for state, extra in (state_swings or {}).items():
+            i = np.searchsorted(self.states, state)
+            if i == len(self.states) or self.states[i] != state:
+                raise ValueError(f'no districts for state {state}')
+            points[i] += extra
+        points = points[self.state_code] / 100
+
+        if method == 'uniform':
+            dem_share = self.dem_share + points
+        else:
+            national = self.national_dem_share
+            dem_share = np.where(
+                points >= 0,
+                1 - (1 - self.dem_share) * (1 - national - points) / (1 - national),
+                self.dem_share * (national + points) / national
+            )
+        dem_share = np.clip(dem_share, 0, 1)
 
-    # can't calcuate pvi for min year because we have no data from before then
-    count_df2 = count_df2[count_df2['year'] > count_df['year'].min()]
+        # the national share moves with the national swing, state swings only
+        # move their own districts
+        pvi = (self.national_dem_share + swing / 100 - dem_share) * 100
+        return pd.DataFrame({
+            'CD': self.districts,
+            'STATE': self.states[self.state_code],
+            'dem_share': dem_share,
+            'dem_margin': (2 * dem_share - 1) * 100,
+            'flipped': (dem_share > 0.5) != (self.dem_share > 0.5),
+            'pvi': pvi,
+            'pvi_pct': pvi_percentile(pvi),
+        })
 
-    # step 5: choose winner for each county. Do this through pandas syntax
-    # for window function.
 
-    count_df2['rank'] = (
-        count_df2
-        .sort_values('candidatevotes', ascending = False)
-        .groupby(['year', level_col])
-        .cumcount() + 1
+def national_party_shares(general_election_df, start, stop):
+    """National two party share of the presidential vote for each year. Each
+        year only depends on that year's returns.
+
+        Args:
+            general_election_df (Pandas DataFrame): Presidential results as
+                read_general_election_df('president') returns them.
+            start (int): First year
+            stop (int): Last year
+
+        Returns:
+            A DataFrame with year, party ('D' or 'R'), candidatevotes,
+            totalvotes and nat_party_share.
+    """
+    return party_shares(get_general_election_results(general_election_df, start, stop, '*', False))
+
+
+def party_shares(results):
+    """Two party share of the vote for each year of normalized results, e.g.
+        get_general_election_results or GeneralElectionIndex.results.
+
+        Returns:
+            A DataFrame with year, party ('D' or 'R'), candidatevotes,
+            totalvotes and nat_party_share.
+    """
+    shares = results.groupby(['year', 'party'])['candidatevotes'].sum().reset_index()
+    shares = shares[shares['party'].isin(PARTIES)]
+    shares['totalvotes'] = shares.groupby('year')['candidatevotes'].transform('sum')
+    shares['nat_party_share'] = shares['candidatevotes']/shares['totalvotes']
+    shares['party'] = shares['party'].str.slice(stop=1)
+
+    return shares.reset_index(drop=True)
+
+
+def format_pvi(pvi, party):
+    """Formats signed PVI values the way Cook does, e.g. 'R+5' or 'D+3'. Values
+        are truncated toward zero, and a PVI of exactly zero is written with the
+        initial of the party that lost.
+
+        Args:
+            pvi (Pandas Series): Signed PVI values from calculate_pvi
+            party (Pandas Series): Party of the winner for each value
+
+        Returns:
+            A series of PVI strings.
+    """
+    party_initial = party.str.slice(stop=1)
+    other_party_initial = pd.Series(
+        np.where(party_initial == 'D', 'R', 'D'), index=pvi.index, dtype=object
     )
-    
-    winners = count_df2[count_df2['rank'] == 1]
-    
-    # step 6: calculate pvi by getting average results of candidate from county
-    # vs. average results from candidate from entire election.
-    winners['county_avg'] = winners[['candidatepct', 'previous_candidatepct']].mean(axis=1)
-    winners['national_avg'] = winners[['electionpct', 'previous_electionpct']].mean(axis=1)
-    winners['diff_in_avgs'] = (winners['county_avg'] - winners['national_avg']) * 100
-    winners['diff_in_avgs'] = winners['diff_in_avgs'].fillna(0)
 
-    
-    # When val is positive assign party as is. When val is negative flip party 
+    # margin for the winner, positive when they did better than nationally
+    diff_in_avgs = pd.Series(np.where(party_initial == 'R', pvi, -pvi), index=pvi.index)
+
+    # When val is positive assign party as is. When val is negative flip party
     # and make positive
-    winners['party_initial'] = winners['party'].str.slice(stop=1)
-    winners['other_party_initial'] = np.where(winners['party_initial'] == 'D', 'R', 'D')
-    winners['pvi'] = np.where(
-        winners['diff_in_avgs'] > 0,
-        winners['party_initial'] + '+' + winners['diff_in_avgs'].astype(str),
-        winners['other_party_initial'] + '+' + winners['diff_in_avgs'].abs().astype(str)
-    )
-    winners['pvi'] = winners['pvi'].str.split('.').str.slice(stop=1).str.join('')
+    formatted = pd.Series(np.where(
+        diff_in_avgs > 0,
+        party_initial + '+' + diff_in_avgs.astype(str),
+        other_party_initial + '+' + diff_in_avgs.abs().astype(str)
+    ), index=pvi.index)
+
+    return formatted.str.split('.').str.slice(stop=1).str.join('')
+
+
+def _lookup(key, query):
+    """Finds the row of key that matches each value of query.
+
+        Returns:
+            The matching row for each query and whether there was a match.
+            Rows without a match point at an arbitrary row.
+    """
+    if not len(key):
+        return np.zeros(len(query), dtype=np.int64), np.zeros(len(query), dtype=bool)
+
+    by_key = np.argsort(key, kind='stable')
+    rows = by_key[np.minimum(np.searchsorted(key[by_key], query), len(key) - 1)]
+    return rows, key[rows] == query
+
+
+def _key_changes(*keys):
+    """Flags the rows of sorted key arrays where any key differs from the row
+        before. The first row is always flagged."""
+    changes = np.ones(len(keys[0]), dtype=bool)
+    changes[1:] = np.any([k[1:] != k[:-1] for k in keys], axis=0)
+    return changes
+
 
-    return winners[['year', level_col, 'candidate', 'party', 'pvi']]
+def _nanmean2(a, b):
+    """Row means of two columns that skip missing values, the same as
+        DataFrame.mean(axis=1)."""
+    count = (~np.isnan(a)).astype(np.float64) + ~np.isnan(b)
+    total = np.where(np.isnan(a), 0, a) + np.where(np.isnan(b), 0, b)
+    with np.errstate(invalid='ignore'):
+        return total / count
 
 
 def clean_cook_pvi_2020(pvi_df, state_codes):
@@ -121,22 +515,131 @@ def clean_cook_pvi(pvi_column, do_rank=False):
             pvi_column (Pandas Series): A Series of PVI values
             do_rank (bool): Convert to percentile or not
         Returns:
-            A series of +/- integers
+            A series of +/- whole numbers, NaN where a value isn't a Cook PVI
     """
-    
-    pvi_cleaned = (
-        np.sum(
-            pvi_column
-            .str.replace('EVEN','R+0')
-            .str.extract('([A-Z])\+(\d+)'),
-            axis = 1
-        )
-    .str.replace('R','')
-    .str.replace('D','-')
-    .astype(int)
-    )
+    pvi_cleaned = decode_cook_pvi(pvi_column.values)
 
     if do_rank:
-        pvi_cleaned = pvi_cleaned.rank(pct = True)
-    
-    return pvi_cleaned
+        pvi_cleaned = pvi_percentile(pvi_cleaned)
+
+    return pd.Series(pvi_cleaned, index=pvi_column.index)
+
+
+def decode_cook_pvi(values):
+    """Converts Cook PVI strings like 'D+12', 'R+3' or 'EVEN' into signed
+        numbers (-12, 3, 0). The strings are parsed as a matrix of character
+        codes, so there is no per value python work. Missing values and
+        strings without a 'D+' or 'R+' margin (other than 'EVEN') decode to
+        NaN.
+
+        Args:
+            values (array like): One dimensional PVI strings
+
+        Returns:
+            A numpy array of float64.
+    """
+    values = np.asarray(values)
+    if values.ndim != 1:
+        raise ValueError(f'expected one dimensional PVI values, got shape {values.shape}')
+
+    # unicode arrays are fixed width UCS4, so each character is one uint32
+    # code and non ascii characters just fail to parse. Missing and non
+    # string values become strings like 'nan' or 'None' that don't parse.
+    u = values.astype('U')
+    width = max(u.dtype.itemsize // 4, 1)
+    b = np.frombuffer(u.tobytes(), dtype=np.uint32).reshape(len(u), width).astype(np.int64)
+    col = np.arange(width)
+
+    # the margin is the run of digits after the first '+'
+    plus = np.argmax(b == ord('+'), axis=1)
+    has_plus = b[np.arange(len(b)), plus] == ord('+')
+    digit = b - ord('0')
+    is_digit = (digit >= 0) & (digit <= 9)
+    after = col > plus[:, None]
+    in_margin = np.logical_and.accumulate(is_digit | ~after, axis=1) & after
+
+    n_digits = in_margin.sum(axis=1)
+    power = np.where(in_margin, plus[:, None] + n_digits[:, None] - col, 0)
+    margin = np.where(in_margin, digit * 10 ** power, 0).sum(axis=1)
+
+    party = np.where(plus > 0, b[np.arange(len(b)), np.maximum(plus - 1, 0)], 0)
+    is_party = (party == ord('D')) | (party == ord('R'))
+    sign = np.where(party == ord('D'), -1, 1)
+
+    even = np.zeros(len(b), dtype=bool)
+    if width >= 4:
+        even = (b[:, :4] == [ord(c) for c in 'EVEN']).all(axis=1) & (b[:, 4:] == 0).all(axis=1)
+
+    parsed = has_plus & is_party & (n_digits > 0)
+    return np.where(parsed, sign * margin, np.where(even, 0, np.nan))
+
+
+def encode_cook_pvi(values):
+    """Converts signed integer PVI into Cook strings, the inverse of
+        decode_cook_pvi. Negative values are 'D+', positive values 'R+' and
+        zero is 'EVEN'. Strings are written into a matrix of bytes.
+
+        Args:
+            values (array like): Signed whole number PVI
+
+        Returns:
+            A numpy array of python strings.
+    """
+    values = np.asarray(values, dtype=np.int64)
+    margin = np.abs(values)
+    n_digits = 1 + sum(
+        (margin >= 10 ** p).astype(np.int64) for p in range(1, len(str(margin.max(initial=0))))
+    )
+    width = max(4, 2 + int(n_digits.max(initial=1)))
+
+    b = np.zeros((len(values), width), dtype=np.uint8)
+    b[:, 0] = np.where(values < 0, ord('D'), ord('R'))
+    b[:, 1] = ord('+')
+    for i in range(width - 2):
+        has_digit = i < n_digits
+        digit = (margin // 10 ** np.maximum(n_digits - 1 - i, 0)) % 10
+        b[:, 2 + i] = np.where(has_digit, digit + ord('0'), 0)
+
+    b[values == 0, :4] = np.frombuffer(b'EVEN', dtype=np.uint8)
+
+    return b.view(f'S{width}').ravel().astype(str).astype(object)
+
+
+def pvi_percentile(values, groups=None):
+    """Percentile rank of each value, the same as Series.rank(pct=True), for
+        every group in one sort. Tied values get their average rank and
+        missing values stay missing.
+
+        Args:
+            values (array like): Values to rank
+            groups (array like): Optional group of each value, e.g. year. Ranks
+                are computed within each group.
+
+        Returns:
+            A numpy array of float64 percentiles.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if groups is None:
+        group_code = np.zeros(len(values), dtype=np.int64)
+    else:
+        _, group_code = np.unique(np.asarray(groups), return_inverse=True)
+
+    ranked = np.flatnonzero(~np.isnan(values))
+    order = ranked[np.lexsort((values[ranked], group_code[ranked]))]
+    sorted_values, sorted_groups = values[order], group_code[order]
+
+    # position of each value within its group, and the runs of tied values
+    group_start = _key_changes(sorted_groups)
+    run_start = _key_changes(sorted_groups, sorted_values)
+    position = np.arange(len(order)) - np.maximum.accumulate(
+        np.where(group_start, np.arange(len(order)), 0)
+    )
+    run = np.cumsum(run_start) - 1
+    first = np.where(run_start, position, 0)[run_start][run] + 1
+    last = np.append(np.flatnonzero(run_start)[1:], len(order)) - 1
+    last = position[last][run] + 1
+    group_size = np.bincount(sorted_groups, minlength=group_code.max(initial=-1) + 1)
+
+    pct = np.full(len(values), np.nan)
+    pct[order] = (first + last) / 2 / group_size[sorted_groups]
+    return pct
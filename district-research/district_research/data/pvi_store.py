@@ -0,0 +1,118 @@
+"""A local store of the per-year aggregates PVI is calculated from, so a new
+    election cycle only needs that year's returns. Aggregates are stored as
+    Parquet partitions keyed by geography level and year, e.g. per county two
+    party shares (level=county_fips) or national party shares (level=national).
+
+    Layout:
+        {root}/level={level}/year={year}/part.parquet
+"""
+import os
+
+import pandas as pd
+
+from .pvi import aggregate_returns, national_party_shares, pvi_from_aggregates
+
+NATIONAL = 'national'
+
+
+class PVIStore:
+    """Reads and writes partitions of PVI aggregates.
+
+        Args:
+            root (str): Directory the store lives in.
+    """
+
+    def __init__(self, root='data/warehouse/pvi'):
+        self.root = root
+
+    def _level_dir(self, level):
+        return os.path.join(self.root, f'level={level}')
+
+    def partition_path(self, level, year):
+        return os.path.join(self._level_dir(level), f'year={int(year)}', 'part.parquet')
+
+    def years(self, level):
+        """Returns the years that have a partition for a level."""
+        level_dir = self._level_dir(level)
+        if not os.path.isdir(level_dir):
+            return []
+
+        return sorted(
+            int(d.split('=')[1]) for d in os.listdir(level_dir)
+            if d.startswith('year=')
+            and os.path.exists(os.path.join(level_dir, d, 'part.parquet'))
+        )
+
+    def write(self, level, year, df):
+        """Replaces a year's partition with df."""
+        path = self.partition_path(level, year)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # write then swap so a reader never sees half a partition
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        df.reset_index(drop=True).to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def read(self, level, years=None):
+        """Reads the partitions for a level, stacked in year order.
+
+            Args:
+                level (str): Geography level, e.g. 'county_fips'
+                years (list): Years to read, defaults to every stored year.
+                    Years that aren't stored are skipped.
+        """
+        stored = self.years(level)
+        if years is not None:
+            stored = [y for y in stored if y in set(years)]
+
+        frames = [pd.read_parquet(self.partition_path(level, y)) for y in stored]
+        if not frames:
+            return pd.DataFrame()
+
+        return pd.concat(frames).reset_index(drop=True)
+
+    def add_returns(self, general_election_df, level_col):
+        """Aggregates returns and writes a partition for each year in them.
+            Years already in the store are replaced.
+
+            Returns:
+                The years that were written.
+        """
+        aggregates = aggregate_returns(general_election_df, level_col)
+        years = sorted(aggregates['year'].unique())
+        for year, group in aggregates.groupby('year', sort=True):
+            self.write(level_col, year, group)
+
+        return [int(y) for y in years]
+
+    def add_national_shares(self, general_election_df, years):
+        """Writes national two party shares for years of presidential returns
+            (see national_party_shares)."""
+        for year in years:
+            self.write(NATIONAL, year, national_party_shares(general_election_df, year, year))
+
+    def calculate_pvi(self, level_col, years=None, formatted=True):
+        """Calculates PVI from stored aggregates. Each year only reads its own
+            partition and the one from four years before, and the earliest
+            stored year is only used as a previous election, so results match
+            calculate_pvi over the full history.
+
+            Args:
+                level_col (str): Geography level, e.g. 'county_fips'
+                years (list): Years to calculate, defaults to every stored year
+                    after the first.
+                formatted (bool): Return PVI as strings instead of signed
+                    numbers.
+        """
+        stored = self.years(level_col)
+        if not stored:
+            return pd.DataFrame()
+
+        years = stored if years is None else [y for y in years if y in stored]
+        needed = sorted(set(years) | {y - 4 for y in years})
+        pvi_df = pvi_from_aggregates(
+            self.read(level_col, needed), level_col,
+            first_year=stored[0], formatted=formatted
+        )
+
+        return pvi_df[pvi_df['year'].isin(years)].reset_index(drop=True)
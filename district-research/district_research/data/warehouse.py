@@ -0,0 +1,133 @@
+"""A local warehouse of ACS views stored as Parquet partitions keyed by estimate
+    type, geography and year. Jobs use it to fetch only the (year, indicator)
+    cells they don't have yet, and readers only open the years and columns they
+    ask for.
+
+    Layout:
+        {root}/est={est}/geo={geo}/year={year}/part.parquet
+"""
+import os
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+
+class ACSWarehouse:
+    """Reads and writes partitions of ACS views.
+
+        Args:
+            root (str): Directory the warehouse lives in.
+    """
+
+    def __init__(self, root='data/warehouse/acs'):
+        self.root = root
+
+    def _geo_dir(self, est, geo):
+        return os.path.join(self.root, f'est={est}', f'geo={geo.replace(" ", "-")}')
+
+    def partition_path(self, est, geo, year):
+        return os.path.join(self._geo_dir(est, geo), f'year={int(year)}', 'part.parquet')
+
+    def years(self, est, geo):
+        """Returns the years that have a partition for an estimate and
+            geography.
+        """
+        geo_dir = self._geo_dir(est, geo)
+        if not os.path.isdir(geo_dir):
+            return []
+
+        return sorted(
+            int(d.split('=')[1]) for d in os.listdir(geo_dir)
+            if d.startswith('year=')
+            and os.path.exists(os.path.join(geo_dir, d, 'part.parquet'))
+        )
+
+    def columns(self, est, geo, year):
+        """Returns the columns stored in a partition. Only the Parquet footer is
+            read.
+        """
+        path = self.partition_path(est, geo, year)
+        if not os.path.exists(path):
+            return []
+
+        return pq.read_schema(path).names
+
+    def missing(self, est, geo, years, columns):
+        """Finds the cells that still need to be fetched.
+
+            Args:
+                est (str): Type of estimate, e.g. 'acs1'
+                geo (str): Geography, e.g. 'congressional district'
+                years (list): Years that should be in the warehouse
+                columns (list): Columns every one of those years should have
+
+            Returns:
+                A dict of year to the list of columns missing for that year.
+                Years that are complete are left out.
+        """
+        missing = {}
+        for year in years:
+            stored = set(self.columns(est, geo, year))
+            year_missing = [c for c in columns if c not in stored]
+            if year_missing:
+                missing[year] = year_missing
+
+        return missing
+
+    def write(self, est, geo, year, df, key):
+        """Adds the columns in df to a year's partition, creating it if needed.
+            Columns that already exist in the partition are replaced.
+
+            Args:
+                est (str): Type of estimate
+                geo (str): Geography
+                year (int): Year of the partition
+                df (Pandas DataFrame): Rows for this year
+                key (list): Columns that identify a row, e.g. ['CD', 'YEAR']
+        """
+        path = self.partition_path(est, geo, year)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        if os.path.exists(path):
+            existing = pd.read_parquet(path)
+            replaced = [c for c in df.columns if c in existing.columns and c not in key]
+            df = existing.drop(replaced, axis=1).merge(df, how='outer', on=key)
+
+        # write then swap so a reader never sees half a partition
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        df.reset_index(drop=True).to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def read(self, est, geo, start=None, stop=None, columns=None):
+        """Reads a range of years for an estimate and geography. Only the
+            partitions in the range are opened and only the requested columns
+            are decoded.
+
+            Args:
+                est (str): Type of estimate
+                geo (str): Geography
+                start (int): First year to read, defaults to the earliest
+                stop (int): Last year to read, defaults to the latest
+                columns (list): Columns to read, defaults to all
+
+            Returns:
+                A DataFrame with the requested years stacked together.
+        """
+        years = [
+            y for y in self.years(est, geo)
+            if (start is None or y >= start) and (stop is None or y <= stop)
+        ]
+
+        frames = []
+        for year in years:
+            path = self.partition_path(est, geo, year)
+            year_columns = None
+            if columns is not None:
+                stored = set(pq.read_schema(path).names)
+                year_columns = [c for c in columns if c in stored]
+            frames.append(pd.read_parquet(path, columns=year_columns))
+
+        if not frames:
+            return pd.DataFrame(columns=columns)
+
+        return pd.concat(frames).reset_index(drop=True)
@@ -0,0 +1,288 @@
+"""Profiles of every district and state: historical turnout tables, the latest
+    ACS indicators, PVI sentences and the racial diversity index. They are
+    computed for every selection at once, so showing or exporting one is a
+    lookup.
+
+    Selections are keyed the way the dashboard names them, 'NY-03' for a
+    district and 'NY-SN' for a state. Profiles are stored as three tables:
+        profiles: one row per key with its area, voting age populations and
+            sentences.
+        indicators: one row per key with the ACS indicators for PROFILE_YEAR.
+        turnout: one row per race, area and year, where the area is the
+            district for house races and the state for senate and president
+            races.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from .data.bundle import Bundle, write_bundle
+
+PROFILES_PATH = 'data/profiles.bundle'
+# bump when the profile tables change, so old files are rebuilt instead of read
+PROFILES_VERSION = 1
+
+PROFILE_YEAR = 2019
+TURNOUT_YEARS = (2012, 2020)
+RACES = ['house', 'senate', 'president']
+
+VOTING_AGE_POP = 'Voting Age Population (Citizens)'
+TURNOUT = 'VOTER TURNOUT PERCENTAGE'
+# derived indicators, see conf/derived_indicators.yml
+DIVERSITY_INDEX = 'Racial Diversity Index'
+MINORITY_PERCENTAGE = 'Minority Percentage'
+
+# the column each table is looked up by
+INDEXES = {'profiles': 'KEY', 'indicators': 'KEY', 'turnout': 'AREA'}
+
+
+def build_profiles(election_results, cd_df, state_df, pvi_tables, district_lists,
+    year=PROFILE_YEAR):
+    """Computes the profile tables for every district and state.
+
+        Args:
+            election_results (dict): Race ('house', 'senate' or 'president') to
+                the results of its GeneralElectionIndex.
+            cd_df (Pandas DataFrame): ACS indicators, including derived ones,
+                by CD and YEAR.
+            state_df (Pandas DataFrame): ACS indicators, including derived
+                ones, by STUSAB and YEAR.
+            pvi_tables (dict): Year to a table of Dist, PVI and pvi_pct.
+            district_lists (dict): State to its district numbers and 'SN'.
+            year (int): Year of ACS indicators to profile.
+
+        Returns:
+            A dict of table name to DataFrame, see the module docstring.
+    """
+    keys = pd.DataFrame(
+        [(s, f'{s}-{d}', d == 'SN') for s, ds in district_lists.items() for d in ds],
+        columns=['STATE', 'KEY', 'IS_STATE']
+    )
+    keys['AREA'] = np.where(keys['IS_STATE'], keys['STATE'], keys['KEY'])
+
+    cd_year = cd_df[cd_df['YEAR'] == year].drop_duplicates('CD').rename(columns={'CD': 'AREA'})
+    state_year = state_df[state_df['YEAR'] == year].drop_duplicates('STUSAB').rename(columns={'STUSAB': 'AREA'})
+    areas = pd.concat([cd_year, state_year], ignore_index=True).drop('YEAR', axis=1)
+    areas['AREA'] = areas['AREA'].astype(str)
+
+    indicators = keys[['KEY', 'AREA']].merge(areas, how='left', on='AREA').drop('AREA', axis=1)
+
+    vap = areas.set_index('AREA')[VOTING_AGE_POP]
+    profiles = keys.copy()
+    profiles['VOTING_AGE_POP'] = profiles['AREA'].map(vap).values
+    profiles['STATE_VOTING_AGE_POP'] = profiles['STATE'].map(vap).values
+
+    # precomputed when the ACS views are built. Views built before they were
+    # declared don't have them.
+    for column in [DIVERSITY_INDEX, MINORITY_PERCENTAGE]:
+        profiles[column] = (
+            profiles['AREA'].map(areas.set_index('AREA')[column]).values
+            if column in areas.columns else np.nan
+        )
+    profiles['DIVERSITY_SENTENCE'] = [
+        None if np.isnan(pct) else diversity_sentence(area, pct, minority)
+        for area, pct, minority in zip(
+            profiles['AREA'], profiles[DIVERSITY_INDEX], profiles[MINORITY_PERCENTAGE]
+        )
+    ]
+
+    for pvi_year, pvi_df in pvi_tables.items():
+        pvi_df = pvi_df.drop_duplicates('Dist').set_index('Dist')
+        pvi = profiles['KEY'].map(pvi_df['PVI'])
+        pct = profiles['KEY'].map(pvi_df['pvi_pct'])
+        profiles[f'PVI_SENTENCE_{pvi_year}'] = [
+            None if is_state or pd.isnull(p) else pvi_sentence(v, p, pvi_year)
+            for is_state, v, p in zip(profiles['IS_STATE'], pvi, pct)
+        ]
+
+    turnout = pd.concat([
+        turnout_tables(
+            election_results[race], 'CD' if race == 'house' else 'state_po',
+            vap, *TURNOUT_YEARS
+        ).assign(RACE=race)
+        for race in RACES
+    ], ignore_index=True)
+
+    return {'profiles': profiles, 'indicators': indicators, 'turnout': turnout}
+
+
+def turnout_tables(results, area_col, voting_age_pop=None, start=TURNOUT_YEARS[0],
+    stop=TURNOUT_YEARS[1]):
+    """Every area's historical turnout table in one pivot. Each area's rows
+        match what get_historical_turnout_table returns for it, with a
+        column for every party seen in any area.
+
+        Args:
+            results (Pandas DataFrame): Results of a GeneralElectionIndex.
+            area_col (str): Column the results are indexed by, CD or state_po.
+            voting_age_pop (Pandas Series): Voting age population by area, the
+                denominator of voter turnout.
+            start (int): First year.
+            stop (int): Last year.
+
+        Returns:
+            A DataFrame with AREA, year, a column of votes for each party,
+            TOTAL and VOTER TURNOUT PERCENTAGE.
+    """
+    years = results['year'].values
+    subset = results[(years >= start) & (years <= stop)]
+    table = (
+        subset.pivot_table(
+            index=[area_col, 'year'], columns='party', values='candidatevotes',
+            aggfunc=np.sum, observed=True
+        )
+        .rename_axis(None, axis=1)
+    )
+    table['TOTAL'] = table.sum(axis=1)
+
+    table = table.reset_index().rename(columns={area_col: 'AREA'})
+    table['AREA'] = table['AREA'].astype(str)
+    table[TURNOUT] = (
+        table['TOTAL'] / table['AREA'].map(voting_age_pop).values
+        if voting_age_pop is not None else np.nan
+    )
+
+    return table
+
+
+def pvi_sentence(pvi, pvi_pct, year):
+    """Says what a district's PVI is and how Democratic it is relative to all
+        other districts and a threshold.
+    """
+    pct = np.round(pvi_pct * 100, 2)
+
+    if pct > 50:
+        substr = f'bottom {100 - pct}%'
+    else:
+        substr = f'top {pct}%'
+
+    return f'This district\'s PVI ({year}) is **{pvi}**. That\'s in the **{substr}** most Democratic districts. Ideally this should be **at least D+24**.'
+
+
+def diversity_sentence(area, diversity_index, minority_percentage):
+    """Says what an area's racial diversity index and minority percentage are."""
+    return f'{area}\'s Racial Diversity Index is {np.round(diversity_index, 2)} on a scale of 0.00 to 1.00. It\'s Minority Percentage is {minority_percentage}%.'
+
+
+def write_profiles(tables, path=PROFILES_PATH):
+    """Writes profile tables to a bundle, indexed for lookups."""
+    write_bundle(path, tables, PROFILES_VERSION, indexes=INDEXES)
+
+
+class DistrictProfiles:
+    """Looks up precomputed profiles.
+
+        Args:
+            read (callable): Function of a table name and key that returns the
+                table's rows for that key. Use from_tables or from_bundle.
+    """
+
+    def __init__(self, read):
+        self._read = read
+
+    @classmethod
+    def from_tables(cls, tables):
+        """Profiles held in memory, e.g. straight from build_profiles."""
+        groups = {
+            name: dict(list(df.groupby(INDEXES[name], sort=False)))
+            for name, df in tables.items()
+        }
+        empty = {name: df.iloc[:0] for name, df in tables.items()}
+
+        return cls(lambda name, key: groups[name].get(key, empty[name]))
+
+    @classmethod
+    def from_bundle(cls, bundle, prefix=''):
+        """Profiles stored in a bundle (see write_profiles), with table names
+            optionally prefixed. bundle can be a Bundle or a path.
+        """
+        if not isinstance(bundle, Bundle):
+            bundle = Bundle(bundle, PROFILES_VERSION)
+
+        return cls(lambda name, key: bundle.read(prefix + name, key))
+
+    def profile(self, key):
+        """Returns a selection's row of the profiles table as a dict, or None
+            if there isn't one."""
+        rows = self._read('profiles', key)
+        if not len(rows):
+            return None
+
+        return rows.iloc[0].to_dict()
+
+    def indicators(self, key):
+        """Returns a selection's indicators as a one column DataFrame, one row
+            per indicator."""
+        ind_df = self._read('indicators', key).drop('KEY', axis=1).T
+        ind_df.columns = ['Indicator Values']
+        return ind_df
+
+    def turnout(self, race, area, with_turnout=True):
+        """Returns a race's historical turnout table for an area (a district
+            for house races, a state otherwise), indexed by year. Parties that
+            never ran in the area are left out, and votes are ints when no
+            party is missing a year, as in get_historical_turnout_table.
+
+            Args:
+                race (str): 'house', 'senate' or 'president'
+                area (str): e.g. 'NY-03' or 'NY'
+                with_turnout (bool): Include VOTER TURNOUT PERCENTAGE when the
+                    voting age population is known.
+        """
+        rows = self._read('turnout', area)
+        table = (
+            rows[rows['RACE'].values == race]
+            .drop(['RACE', 'AREA'], axis=1)
+            .set_index('year')
+            .dropna(axis=1, how='all')
+        )
+        if not with_turnout and TURNOUT in table.columns:
+            table = table.drop(TURNOUT, axis=1)
+
+        votes = [c for c in table.columns if c != TURNOUT]
+        if len(table) and not table[votes].isnull().values.any():
+            table[votes] = table[votes].astype(np.int64)
+
+        return table
+
+
+def export_profile(profiles, key, save_dir):
+    """Writes a selection's profile for reports: its indicators and each race's
+        turnout table as csvs, and its sentences as markdown.
+
+        Args:
+            profiles (DistrictProfiles): Profiles to export from.
+            key (str): Selection, e.g. 'NY-03' or 'NY-SN'
+            save_dir (str): Directory to write to, created if needed.
+
+        Returns:
+            The paths written.
+    """
+    profile = profiles.profile(key)
+    if profile is None:
+        return []
+
+    os.makedirs(save_dir, exist_ok=True)
+    paths = []
+
+    def save(df, name):
+        paths.append(os.path.join(save_dir, name))
+        df.to_csv(paths[-1])
+
+    save(profiles.indicators(key), 'indicators.csv')
+    for race in RACES:
+        if race == 'house' and profile['IS_STATE']:
+            continue
+        area = profile['STATE'] if race != 'house' else profile['AREA']
+        save(profiles.turnout(race, area), f'turnout_{race}.csv')
+
+    sentences = [
+        profile[c] for c in sorted(profile)
+        if (c.startswith('PVI_SENTENCE_') or c == 'DIVERSITY_SENTENCE') and profile[c]
+    ]
+    paths.append(os.path.join(save_dir, 'profile.md'))
+    with open(paths[-1], 'w') as f:
+        f.write(f'# {key}\n\n' + '\n\n'.join(sentences) + '\n')
+
+    return paths
@@ -1,29 +1,100 @@
+import copy
+import hashlib
+import io
 import os
+from concurrent.futures import ProcessPoolExecutor
 
 import geopandas as gpd
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
+from matplotlib.collections import PathCollection
+from matplotlib.figure import Figure
+from matplotlib.path import Path
 
 from .data.acs import get_acs_data_table
 from .data.elections import get_general_election_results
 
+# how maps are drawn. Bump the version when that changes so cached maps (see
+# cache.MapCache) aren't reused.
+MAP_STYLE = {'version': 2, 'cmap': 'Blues', 'edgecolor': 'black', 'format': 'png'}
+
+class DistrictMapTable:
+    """A map table of ZCTAs (see make_map_table) with its indicators stored as
+        floats and an index from congressional district and state to row
+        positions. Slicing out a district is a lookup of its k rows instead of
+        a scan and copy of the national table.
+
+        Args:
+            map_cd_df (Geopandas DataFrame): Dataframe with shape info,
+            congressional district info and zip code
+            indicators (list): Indicator columns to store as floats. Defaults
+            to every column that has an '{indicator} Error Code' column.
+    """
+
+    def __init__(self, map_cd_df, indicators=None):
+        if indicators is None:
+            indicators = [
+                c[:-len(' Error Code')] for c in map_cd_df.columns
+                if c.endswith(' Error Code')
+            ]
+
+        df = map_cd_df.reset_index(drop=True)
+        for c in indicators:
+            if not pd.api.types.is_float_dtype(df[c]):
+                df[c] = pd.to_numeric(df[c], errors='coerce').astype(float)
+
+        self.df = df
+        self.indicators = indicators
+        self.districts = df.groupby('CD').indices
+        self.states = df.groupby(df['CD'].str.slice(stop=2)).indices
+        self._empty = np.array([], dtype=np.int64)
+        self._versions = {}
+
+    def positions(self, district):
+        """Row positions for a district like 'NY-03', or for every district in
+            a state when the district is 'SN' (e.g. 'NY-SN')."""
+        if district[-2:] == 'SN':
+            return self.states.get(district[:2], self._empty)
+
+        return self.districts.get(district, self._empty)
+
+    def get(self, district):
+        """Returns the rows for a district (see positions)."""
+        return self.df.take(self.positions(district))
+
+    def data_version(self, district, characteristic):
+        """map_data_version of a district's rows, computed once per table.
+            The table never changes once built, so the version can't either."""
+        key = (district, characteristic)
+        version = self._versions.get(key)
+        if version is None:
+            version = self._versions[key] = map_data_version(self.get(district), characteristic)
+
+        return version
+
+
 def plot_district_characteristic(map_cd_df, district, characteristic, 
-    save_dir=None):
+    save_dir=None, title=None):
     """Plots and saves the map for a given congressional district and
         characteristic.
 
         Args:
-            map_cd_df (Geopandas DataFrame): Dataframe with shape info,
-            congressional district info and zip code
+            map_cd_df (DistrictMapTable or Geopandas DataFrame): Dataframe with
+            shape info, congressional district info and zip code. Pass a
+            DistrictMapTable when plotting more than once.
             district (str): The district to plot
-            characteristic (str): The code to plot from the data table from
-            ACS data.
+            characteristic (str): The column to plot from the map table.
+            title (str): Title of the plot, defaults to the characteristic.
         Returns
             Nothing, but plots a map.
     """
-
-    if district[-2:] != 'SN':
+    # a raw table is only drawn once, so it is filtered directly rather than
+    # indexed
+    if isinstance(map_cd_df, DistrictMapTable):
+        district_df = map_cd_df.get(district)
+    elif district[-2:] != 'SN':
         district_df = map_cd_df[(map_cd_df['CD'] == district)]
     else:
         district_df = map_cd_df[(map_cd_df['CD'].str.startswith(district[:2]))]
@@ -35,19 +106,22 @@ def plot_district_characteristic(map_cd_df, district, characteristic,
 
     # always convert to float to ensure that percent estimates and estimates can
     # be read in
-    district_df[characteristic] = district_df[characteristic].astype(float)
+    if not pd.api.types.is_float_dtype(district_df[characteristic]):
+        district_df = district_df.assign(**{
+            characteristic: pd.to_numeric(district_df[characteristic], errors='coerce').astype(float)
+        })
 
     fig, ax = plt.subplots()
     (
         district_df
         [pd.notnull(district_df['geometry'])]
-        .plot(column=characteristic, legend=True, cmap='Blues', edgecolor="black", ax=ax)
+        .plot(column=characteristic, legend=True, cmap=MAP_STYLE['cmap'], edgecolor=MAP_STYLE['edgecolor'], ax=ax)
     )
 
     plt.xlabel('Latitude')
     plt.ylabel('Longitude')
 
-    plt.title(characteristic)
+    plt.title(title or characteristic)
 
     if save_dir:
         if not os.path.exists(save_dir):
@@ -57,14 +131,266 @@ def plot_district_characteristic(map_cd_df, district, characteristic,
     return fig
 
 
-def plot_house_general_election_results(df, district, save_dir, start, stop):
+def render_district_map(map_table, district, characteristic, title=None, cache=None):
+    """Renders the map plot_district_characteristic draws as PNG bytes. The
+        map is drawn on its own figure without pyplot, so it is safe to call
+        from several threads at once. With a cache, a map that was rendered
+        before from the same data and style is a file read.
+
+        Args:
+            map_table (DistrictMapTable): Indexed map table.
+            district (str): The district to plot
+            characteristic (str): The column to plot from the map table.
+            title (str): Title of the plot, defaults to the characteristic.
+            cache (MapCache): Optional cache of rendered maps.
+
+        Returns:
+            The map as PNG bytes.
+    """
+    if cache is not None:
+        key = cache.key(
+            district, characteristic,
+            map_table.data_version(district, characteristic),
+            {**MAP_STYLE, 'title': title or characteristic}
+        )
+        png = cache.get(key)
+        if png is not None:
+            return png
+
+    png = _DistrictMap(map_table.get(district)).render(characteristic, title or characteristic)
+
+    if cache is not None:
+        cache.put(key, png)
+
+    return png
+
+
+def render_district_maps(map_table, districts, characteristics, save_dir='outputs',
+    title='{characteristic} ({district})', workers=None, cache=None):
+    """Renders a map of every characteristic for every district, the batch
+        equivalent of calling plot_district_characteristic for each pair.
+
+        Each district is drawn once: its shapes become one patch collection
+        that is only re-colored and re-titled for each characteristic.
+        Districts are spread across a pool of processes that draw on figures
+        without a display, so this scales with the number of cores.
+
+        Args:
+            map_table (DistrictMapTable): Indexed map table.
+            districts (list): Districts to plot, e.g. ['NY-03', 'NY-SN']
+            characteristics (list): Columns of the map table to plot.
+            save_dir (str): Maps go in {save_dir}/{district}/{characteristic}.png
+            title (str): Format string for the title, with {characteristic}
+                and {district} fields.
+            workers (int): Number of processes, defaults to the number of cores.
+            cache (MapCache): Optional cache of rendered maps. Maps whose data
+                and style haven't changed are copied from it instead of drawn,
+                and files that already hold them aren't rewritten.
+
+        Returns:
+            The paths of the saved maps.
+    """
+    columns = ['geometry', *characteristics, *[f'{c} Error Code' for c in characteristics]]
+    jobs = [
+        (d, map_table.get(d)[columns], characteristics, os.path.join(save_dir, d), title, cache)
+        for d in districts
+    ]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        saved = executor.map(_render_district, *zip(*jobs)) if jobs else []
+        saved = [path for paths in saved for path in paths]
+
+    # workers skip eviction so the cache directory is only scanned once
+    if cache is not None:
+        cache.evict()
+
+    return saved
+
+
+def _render_district(district, district_df, characteristics, save_dir, title, cache=None):
+    """Draws one district's shapes once and saves a map per characteristic."""
+    os.makedirs(save_dir, exist_ok=True)
+    saved = []
+
+    pending = []
+    for characteristic in characteristics:
+        path = os.path.join(save_dir, f'{characteristic}.png')
+        map_title = title.format(characteristic=characteristic, district=district)
+        key = None
+        if cache is not None:
+            key = cache.key(
+                district, characteristic,
+                map_data_version(district_df, characteristic),
+                {**MAP_STYLE, 'title': map_title}
+            )
+            png = cache.get(key)
+            if png is not None:
+                _write_if_changed(path, png)
+                saved.append(path)
+                continue
+        pending.append((characteristic, path, map_title, key))
+
+    if not pending:
+        return saved
+
+    district_map = _DistrictMap(district_df)
+    for characteristic, path, map_title, key in pending:
+        png = district_map.render(characteristic, map_title)
+        _write_if_changed(path, png)
+        if cache is not None:
+            cache.put(key, png, evict=False)
+        saved.append(path)
+
+    return saved
+
+
+class _DistrictMap:
+    """One district's shapes drawn once as a patch collection on a figure that
+        isn't managed by pyplot, so it draws without a display. render only
+        re-colors and re-titles it for each characteristic.
+
+        Maps are drawn like GeoDataFrame.plot: rows with an error code aren't
+        drawn, the axes are fit to the drawn shapes and the aspect is set the
+        way geopandas sets it for the table's crs. A district with no shapes
+        or a characteristic with no values gives a map with only a title.
+    """
+
+    def __init__(self, district_df):
+        # missing and empty shapes (e.g. ZCTAs simplified away) aren't drawn,
+        # same as GeoDataFrame.plot
+        self.df = district_df[_has_shape(district_df['geometry'].values)]
+        crs = getattr(district_df, 'crs', None)
+        self.is_geographic = crs is not None and crs.is_geographic
+
+        paths, self.rows = _geometry_paths(self.df['geometry'].values)
+        self.bounds = np.array([g.bounds for g in self.df['geometry'].values]).reshape(-1, 4)
+
+        self.fig = Figure()
+        self.ax = self.fig.subplots()
+        cmap = copy.copy(plt.get_cmap(MAP_STYLE['cmap']))
+        cmap.set_bad((0, 0, 0, 0))
+        self.collection = PathCollection(paths, cmap=cmap)
+        self.ax.add_collection(self.collection)
+        # the colorbar is always made so every map has the same layout, and
+        # is hidden when nothing is drawn
+        self.collection.set_clim(0, 1)
+        self.colorbar = self.fig.colorbar(self.collection, ax=self.ax)
+        self.ax.set_xlabel('Latitude')
+        self.ax.set_ylabel('Longitude')
+
+    def render(self, characteristic, title):
+        """Returns the map of a characteristic as PNG bytes."""
+        values = self.df[characteristic].values.astype(float)
+        values[pd.notnull(self.df[f'{characteristic} Error Code']).values] = np.nan
+        shown = ~np.isnan(values)
+
+        self.collection.set_array(np.ma.masked_invalid(values[self.rows]))
+        self.collection.set_edgecolor(
+            np.where(shown[self.rows, None], (0, 0, 0, 1), (0, 0, 0, 0))
+        )
+        self.collection.set_visible(bool(shown.any()))
+        self.colorbar.ax.set_visible(bool(shown.any()))
+
+        if shown.any():
+            self.collection.set_clim(values[shown].min(), values[shown].max())
+            bounds = self.bounds[shown]
+            minx, miny = bounds[:, 0].min(), bounds[:, 1].min()
+            maxx, maxy = bounds[:, 2].max(), bounds[:, 3].max()
+            self.ax.set_xlim(minx, maxx)
+            self.ax.set_ylim(miny, maxy)
+            # same as GeoDataFrame.plot's aspect='auto'
+            if self.is_geographic:
+                self.ax.set_aspect(1 / np.cos(np.mean([miny, maxy]) * np.pi / 180))
+            else:
+                self.ax.set_aspect('equal')
+        else:
+            # nothing is drawn, so don't carry over the last map's scale
+            self.collection.set_clim(0, 1)
+            self.ax.set_xlim(0, 1)
+            self.ax.set_ylim(0, 1)
+            self.ax.set_aspect('auto')
+        self.colorbar.update_normal(self.collection)
+        self.ax.set_title(title)
+
+        return _png_bytes(self.fig)
+
+
+def map_data_version(district_df, characteristic):
+    """Hashes everything a map of characteristic is drawn from: the values,
+        their error codes and the shapes."""
+    digest = hashlib.sha1()
+    digest.update(
+        pd.util.hash_pandas_object(
+            district_df[[characteristic, f'{characteristic} Error Code']], index=False
+        ).values.tobytes()
+    )
+    for geometry in district_df['geometry'].values:
+        digest.update(b'' if geometry is None else geometry.wkb)
+
+    return digest.hexdigest()
+
+
+def _png_bytes(fig):
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png')
+    return buffer.getvalue()
+
+
+def _write_if_changed(path, content):
+    """Writes content to path unless the file already holds it."""
+    if os.path.exists(path) and os.path.getsize(path) == len(content):
+        with open(path, 'rb') as f:
+            if f.read() == content:
+                return
+
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def _has_shape(geometries):
+    """Whether each geometry is present and not empty."""
+    return np.array([g is not None and not g.is_empty for g in geometries], dtype=bool)
+
+
+def _geometry_paths(geometries):
+    """Converts (multi)polygons into matplotlib paths, with holes. Returns the
+        paths and, for each path, the position of the geometry it came from.
+        Missing and empty geometries have no paths."""
+    paths, rows = [], []
+    for i, geometry in enumerate(geometries):
+        if geometry is None or geometry.is_empty:
+            continue
+        polygons = getattr(geometry, 'geoms', [geometry])
+        for polygon in polygons:
+            if polygon.is_empty:
+                continue
+            rings = [polygon.exterior, *polygon.interiors]
+            paths.append(Path.make_compound_path(*[
+                Path(np.asarray(ring.coords)[:, :2], closed=True) for ring in rings
+            ]))
+            rows.append(i)
+
+    return paths, np.array(rows, dtype=np.int64)
+
+
+def plot_house_general_election_results(df, district, save_dir, start, stop,
+    results=None):
     """Plots general election results in a given district for Democrats and
         Republicans.
+
+        Args:
+            results (Pandas DataFrame): Optional results for this district, as
+            returned by get_general_election_results. When plotting many
+            districts, query them all at once and pass each district's
+            results here instead of redoing the query per district.
     """
 
     # TODO(any): extend this to senate and presidential races if needed
     sns.set_style('whitegrid')
-    res = get_general_election_results(df, start, stop, district, True)
+    if results is not None:
+        res = results
+    else:
+        res = get_general_election_results(df, start, stop, district, True)
     
     plt.figure(figsize=(15, 4))
     sns.lineplot(data=res, x='year', y='candidatevotes', hue='party')
@@ -77,3 +403,4 @@ def plot_house_general_election_results(df, district, save_dir, start, stop):
         os.mkdir(save_dir)
     
     plt.savefig(f'{save_dir}/{district}-candidate-votes-{start}-{stop}.png')
+    plt.close()
@@ -17,6 +17,6 @@ setuptools.setup(
     ],
     install_requires = [
         'pandas', 'matplotlib', 'geopandas', 
-        'numpy', 'bs4', 'requests'
+        'numpy', 'bs4', 'requests', 'pyarrow', 'scipy'
     ]
 )
\ No newline at end of file
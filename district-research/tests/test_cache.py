@@ -0,0 +1,19 @@
+import pickle
+
+from district_research.cache import MapCache
+
+
+def test_map_cache_pickles(tmp_path):
+    cache = MapCache(str(tmp_path), memory_items=4)
+    key = cache.key('NY-03', 'Median Age', 'version', {'title': 'Median Age'})
+    cache.put(key, b'png')
+
+    copy = pickle.loads(pickle.dumps(cache))
+
+    assert copy.cache_dir == cache.cache_dir
+    assert copy.memory_items == 4
+    # the memory cache isn't sent along, but the entry is still on disk
+    assert not copy._recent
+    assert copy.get(key) == b'png'
+    copy.put(key, b'new png')
+    assert copy.get(key) == b'new png'
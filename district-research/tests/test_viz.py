@@ -0,0 +1,54 @@
+import os
+
+import geopandas as gpd
+from shapely.geometry import Polygon, box
+
+from district_research.cache import MapCache
+from district_research.viz import DistrictMapTable, render_district_maps
+
+PNG_MAGIC = b'\x89PNG'
+
+
+def _map_table():
+    return DistrictMapTable(gpd.GeoDataFrame(
+        {
+            'CD': ['NY-03', 'NY-03', 'NY-03', 'NY-03', 'NY-04'],
+            'Median Age': [30.0, 40.0, 50.0, 60.0, 35.0],
+            'Median Age Error Code': [None, None, None, '-555555555', None],
+            'geometry': [box(0, 0, 1, 1), None, Polygon(), box(1, 0, 2, 1), None],
+        },
+        geometry='geometry', crs='EPSG:4326'
+    ))
+
+
+def test_render_district_maps_with_cache(tmp_path):
+    table = _map_table()
+    cache = MapCache(str(tmp_path / 'cache'))
+    save_dir = str(tmp_path / 'maps')
+
+    # NY-03 has missing and empty shapes next to drawn ones, and NY-04 has no
+    # shape at all, so it gets a blank map
+    saved = render_district_maps(
+        table, ['NY-03', 'NY-04'], ['Median Age'], save_dir=save_dir, workers=1, cache=cache
+    )
+
+    assert sorted(saved) == [
+        os.path.join(save_dir, 'NY-03', 'Median Age.png'),
+        os.path.join(save_dir, 'NY-04', 'Median Age.png'),
+    ]
+    first = {}
+    for path in saved:
+        with open(path, 'rb') as f:
+            first[path] = f.read()
+        assert first[path].startswith(PNG_MAGIC)
+
+    # the second run copies every map from the cache
+    for path in saved:
+        os.remove(path)
+    saved = render_district_maps(
+        table, ['NY-03', 'NY-04'], ['Median Age'], save_dir=save_dir, workers=1, cache=cache
+    )
+    for path in saved:
+        with open(path, 'rb') as f:
+            assert f.read() == first[path]
+
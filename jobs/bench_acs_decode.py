@@ -0,0 +1,110 @@
+"""Benchmarks how much memory it takes to decode a full size ZCTA ACS response,
+    comparing the regular path (whole body, then response.json(), then a
+    DataFrame) with the streaming decoder. The payload is synthetic but has the
+    same shape as an acs5 pull of every ZCTA for the indicators in the config.
+
+    Each mode runs in a fresh process so peak resident memory (RSS) can be
+    measured separately.
+
+    Usage:
+        python jobs/bench_acs_decode.py --ROWS 33120
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+from district_research.data.acs import STREAM_CHUNK_SIZE, decode_acs_stream, _parse_payload
+
+def _peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def make_payload(path, codes, rows, seed=0):
+    """Writes a synthetic response to path, formatted the way the Census API
+        formats it: one row per line."""
+    rng = random.Random(seed)
+    header = [*codes, *[c + 'A' for c in codes], 'zip code tabulation area']
+
+    with open(path, 'w') as f:
+        f.write('[' + json.dumps(header))
+        for i in range(rows):
+            values = [
+                f'{rng.uniform(0, 100):.1f}' if c.endswith('PE') else str(rng.randint(0, 100000))
+                for c in codes
+            ]
+            annotations = [
+                '-666666666' if rng.random() < 0.02 else None for _ in codes
+            ]
+            f.write(',\n' + json.dumps([*values, *annotations, f'{i:05d}']))
+        f.write(']')
+
+
+def run_mode(mode, path, codes):
+    """Decodes the payload at path and reports timings and memory as json."""
+    baseline = _peak_rss_mb()
+    start = time.perf_counter()
+
+    if mode == 'json':
+        with open(path, 'rb') as f:
+            text = f.read()
+        df = _parse_payload(json.loads(text), codes)
+    else:
+        with open(path, 'rb') as f:
+            df = decode_acs_stream(iter(lambda: f.read(STREAM_CHUNK_SIZE), b''), codes)
+
+    print(json.dumps({
+        'mode': mode,
+        'seconds': time.perf_counter() - start,
+        'rows': len(df),
+        'table_mb': df.memory_usage(deep=True).sum() / 1024 ** 2,
+        'baseline_rss_mb': baseline,
+        'peak_rss_mb': _peak_rss_mb(),
+    }))
+
+
+def main(args):
+    with open('conf/indicators.yml', 'r') as f:
+        codes = list(yaml.safe_load(f)['current'])
+
+    if args['MODE']:
+        run_mode(args['MODE'], args['PATH'], codes)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'zcta.json')
+        make_payload(path, codes, args['ROWS'])
+        print(f'payload: {args["ROWS"]} rows, {os.path.getsize(path) / 1024 ** 2:.1f} MB')
+
+        for mode in ['json', 'stream']:
+            out = subprocess.run(
+                [sys.executable, __file__, '--MODE', mode, '--PATH', path],
+                check=True, capture_output=True, text=True
+            ).stdout
+            res = json.loads(out.strip().splitlines()[-1])
+            print(
+                f'{mode:>6}: {res["seconds"]:.2f}s, '
+                f'peak rss {res["peak_rss_mb"]:.0f} MB '
+                f'(+{res["peak_rss_mb"] - res["baseline_rss_mb"]:.0f} MB over imports), '
+                f'table {res["table_mb"]:.1f} MB'
+            )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ROWS', type=int, default=33120,
+        help='number of geographies in the synthetic payload (~all ZCTAs)')
+    parser.add_argument('--MODE', type=str, choices=['json', 'stream'],
+        help='internal: decode in this process with one mode')
+    parser.add_argument('--PATH', type=str, help='internal: payload to decode')
+    args = vars(parser.parse_args())
+
+    main(args)
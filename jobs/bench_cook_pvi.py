@@ -0,0 +1,85 @@
+"""Benchmarks the Cook PVI codec against the string based parsing it replaced,
+    on a synthetic column of Cook PVI strings. Results of both are checked to
+    be identical.
+
+    Usage:
+        python jobs/bench_cook_pvi.py --ROWS 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from district_research.data.pvi import decode_cook_pvi, encode_cook_pvi, pvi_percentile
+
+
+def legacy_clean_cook_pvi(pvi_column, do_rank=False):
+    """The previous clean_cook_pvi, kept here to compare against."""
+    pvi_cleaned = (
+        np.sum(
+            pvi_column
+            .str.replace('EVEN','R+0')
+            .str.extract('([A-Z])\+(\d+)'),
+            axis = 1
+        )
+    .str.replace('R','')
+    .str.replace('D','-')
+    .astype(int)
+    )
+
+    if do_rank:
+        pvi_cleaned = pvi_cleaned.rank(pct = True)
+
+    return pvi_cleaned
+
+
+def legacy_encode(values):
+    return pd.Series([
+        'EVEN' if v == 0 else f'{"D" if v < 0 else "R"}+{abs(v)}' for v in values
+    ])
+
+
+def _time(fn, *args, **kwargs):
+    start = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return out, time.perf_counter() - start
+
+
+def main(args):
+    rng = np.random.default_rng(0)
+    values = rng.integers(-45, 46, args['ROWS'])
+    groups = rng.integers(2000, 2021, args['ROWS'])
+    strings = pd.Series(legacy_encode(values))
+    print(f'column: {len(strings)} values')
+
+    checks = []
+
+    legacy, seconds = _time(legacy_clean_cook_pvi, strings)
+    decoded, codec_seconds = _time(decode_cook_pvi, strings.values)
+    print(f'decode:     legacy {seconds:.2f}s, codec {codec_seconds:.2f}s')
+    checks.append(('decode', np.array_equal(legacy.values, decoded)))
+
+    legacy, seconds = _time(lambda: pd.Series(decoded).groupby(groups).rank(pct=True))
+    pct, codec_seconds = _time(pvi_percentile, decoded, groups=groups)
+    print(f'percentile: legacy {seconds:.2f}s, codec {codec_seconds:.2f}s')
+    checks.append(('percentile', np.array_equal(legacy.values, pct)))
+
+    legacy, seconds = _time(legacy_encode, values)
+    encoded, codec_seconds = _time(encode_cook_pvi, values)
+    print(f'encode:     legacy {seconds:.2f}s, codec {codec_seconds:.2f}s')
+    checks.append(('encode', np.array_equal(legacy.values, encoded)))
+
+    failed = [name for name, ok in checks if not ok]
+    if failed:
+        raise SystemExit(f'results differ for: {", ".join(failed)}')
+    print('results match')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ROWS', type=int, default=1000000,
+        help='number of PVI values in the synthetic column')
+    args = vars(parser.parse_args())
+
+    main(args)
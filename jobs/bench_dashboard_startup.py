@@ -0,0 +1,87 @@
+"""Benchmarks how long the dashboard takes to load its data on a cold start,
+    reading the sources (csvs, the ACS warehouse and the geometry store)
+    compared to memory mapping the bundle built by jobs/mk_dashboard_bundle.py.
+    Both load every dataset and the map table for every state, and each runs in
+    a fresh process so nothing is in memory yet. The sources path still uses
+    the election feather caches in data/cache/elections if they exist.
+
+    Usage:
+        python jobs/bench_dashboard_startup.py --BUNDLE_PATH data/dashboard.bundle
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'streamlit'))
+
+from store import BUNDLE_PATH, make_bundle_store, make_source_store
+
+def _peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_mode(mode, bundle_path):
+    """Loads the dashboard's data one way and reports timings as json."""
+    start = time.perf_counter()
+    store = make_source_store() if mode == 'sources' else make_bundle_store(bundle_path)
+    store.preload()
+    preloaded = time.perf_counter() - start
+
+    for state in store.get('district_lists'):
+        store.get('map_table', state)
+
+    timings = store.timings()
+    print(json.dumps({
+        'mode': mode,
+        'preload_seconds': preloaded,
+        'seconds': time.perf_counter() - start,
+        'peak_rss_mb': _peak_rss_mb(),
+        'slowest': (
+            timings[timings['args'] == '']
+            .sort_values('seconds', ascending=False)
+            .head(3)[['dataset', 'seconds']]
+            .values.tolist()
+        ),
+    }))
+
+
+def main(args):
+    if args['MODE']:
+        run_mode(args['MODE'], args['BUNDLE_PATH'])
+        return
+
+    if not os.path.exists(args['BUNDLE_PATH']):
+        raise SystemExit(f'{args["BUNDLE_PATH"]} does not exist, run jobs/mk_dashboard_bundle.py')
+    print(f'bundle: {os.path.getsize(args["BUNDLE_PATH"]) / 1024 ** 2:.1f} MB')
+
+    for mode in ['sources', 'bundle']:
+        for run in range(args['RUNS']):
+            out = subprocess.run(
+                [sys.executable, __file__, '--MODE', mode, '--BUNDLE_PATH', args['BUNDLE_PATH']],
+                check=True, capture_output=True, text=True
+            ).stdout
+            res = json.loads(out.strip().splitlines()[-1])
+            slowest = ', '.join(f'{name} {seconds:.2f}s' for name, seconds in res['slowest'])
+            print(
+                f'{mode:>7} #{run + 1}: {res["seconds"]:.2f}s '
+                f'({res["preload_seconds"]:.2f}s before maps), '
+                f'peak rss {res["peak_rss_mb"]:.0f} MB, slowest: {slowest}'
+            )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--BUNDLE_PATH', type=str, default=BUNDLE_PATH,
+        help='bundle built by jobs/mk_dashboard_bundle.py')
+    parser.add_argument('--RUNS', type=int, default=3,
+        help='number of cold starts to time for each mode')
+    parser.add_argument('--MODE', type=str, choices=['sources', 'bundle'],
+        help='internal: load the data in this process one way')
+    args = vars(parser.parse_args())
+
+    main(args)
@@ -0,0 +1,138 @@
+"""Benchmarks the county PVI engine against the groupby and merge version it
+    replaced, on a synthetic dataset with ten times as many counties as the MIT
+    county returns. The two outputs are also checked to be identical.
+
+    Usage:
+        python jobs/bench_pvi.py --SCALE 10
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from district_research.data.pvi import calculate_pvi
+
+N_COUNTIES = 3155
+YEARS = range(2000, 2021, 4)
+PARTIES = ['DEMOCRAT', 'REPUBLICAN', 'GREEN', 'OTHER']
+
+
+def make_returns(scale, seed=0):
+    """Builds county returns shaped like countypres_2000-2020.csv. Half of the
+        counties report their votes split across two modes, as many did in
+        2020."""
+    rng = np.random.default_rng(seed)
+    n_counties = N_COUNTIES * scale
+    fips = np.arange(1000, 1000 + n_counties)
+
+    frames = []
+    for year in YEARS:
+        for i, party in enumerate(PARTIES):
+            votes = rng.integers(0, 50000, n_counties)
+            # democratic totals are even and republican totals odd, so no
+            # county is an exact tie and the winner doesn't depend on sorting
+            if party == 'DEMOCRAT':
+                votes = votes * 2
+            elif party == 'REPUBLICAN':
+                votes = votes * 2 + 1
+
+            split = fips % 2 == 0
+            first = np.where(split, votes // 2, votes)
+            frames.append(pd.DataFrame({
+                'year': year, 'county_fips': fips, 'party': party,
+                'candidate': f'{party} CANDIDATE {year}',
+                'mode': np.where(split, 'ELECTION DAY', 'TOTAL'),
+                'candidatevotes': first,
+            }))
+            frames.append(pd.DataFrame({
+                'year': year, 'county_fips': fips[split], 'party': party,
+                'candidate': f'{party} CANDIDATE {year}',
+                'mode': 'ABSENTEE', 'candidatevotes': (votes - first)[split],
+            }))
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def legacy_calculate_pvi(general_election_df, level_col):
+    """The groupby, merge and sort implementation calculate_pvi replaced, kept
+        here to compare against."""
+    count_df = (
+        general_election_df
+        [general_election_df['party'].isin(['DEMOCRAT', 'REPUBLICAN'])]
+        .groupby(['year', level_col, 'candidate', 'party'])
+        .sum()['candidatevotes']
+        .reset_index()
+    )
+    count_df['total'] = count_df.groupby(['year', level_col]).transform('sum')['candidatevotes']
+    count_df['candidatepct'] = count_df['candidatevotes']/count_df['total']
+    count_df['total_election_per_party'] = count_df.groupby(['year', 'party']).transform('sum')['candidatevotes']
+    count_df['total_election'] = count_df.groupby(['year']).transform('sum')['candidatevotes']
+    count_df['electionpct'] = count_df['total_election_per_party']/count_df['total_election']
+
+    count_df['previous_year'] = count_df['year'] - 4
+    count_df2 = count_df.merge(
+        count_df[['year', 'party', level_col, 'candidatepct', 'electionpct']].rename(columns={
+            'year': 'previous_year',
+            'candidatepct': 'previous_candidatepct',
+            'electionpct': 'previous_electionpct'
+        }),
+        how='left', on=['previous_year', 'party', level_col]
+    )
+    count_df2 = count_df2[count_df2['year'] > count_df['year'].min()].copy()
+    count_df2['rank'] = (
+        count_df2
+        .sort_values('candidatevotes', ascending = False)
+        .groupby(['year', level_col])
+        .cumcount() + 1
+    )
+
+    winners = count_df2[count_df2['rank'] == 1].copy()
+    winners['county_avg'] = winners[['candidatepct', 'previous_candidatepct']].mean(axis=1)
+    winners['national_avg'] = winners[['electionpct', 'previous_electionpct']].mean(axis=1)
+    winners['diff_in_avgs'] = ((winners['county_avg'] - winners['national_avg']) * 100).fillna(0)
+    winners['party_initial'] = winners['party'].str.slice(stop=1)
+    winners['other_party_initial'] = np.where(winners['party_initial'] == 'D', 'R', 'D')
+    winners['pvi'] = np.where(
+        winners['diff_in_avgs'] > 0,
+        winners['party_initial'] + '+' + winners['diff_in_avgs'].astype(str),
+        winners['other_party_initial'] + '+' + winners['diff_in_avgs'].abs().astype(str)
+    )
+    winners['pvi'] = winners['pvi'].str.split('.').str.slice(stop=1).str.join('')
+
+    return winners[['year', level_col, 'candidate', 'party', 'pvi']]
+
+
+def _time(fn, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - start
+
+
+def main(args):
+    df = make_returns(args['SCALE'])
+    print(f'returns: {len(df)} rows, {df["county_fips"].nunique()} counties')
+
+    legacy, legacy_seconds = _time(legacy_calculate_pvi, df, 'county_fips')
+    engine, engine_seconds = _time(calculate_pvi, df, 'county_fips')
+    _, numeric_seconds = _time(lambda d, c: calculate_pvi(d, c, formatted=False), df, 'county_fips')
+
+    print(f'legacy:            {legacy_seconds:.2f}s')
+    print(f'engine:            {engine_seconds:.2f}s')
+    print(f'engine (numeric):  {numeric_seconds:.2f}s')
+
+    legacy = legacy.reset_index(drop=True)
+    if legacy.equals(engine):
+        print(f'outputs match ({len(engine)} rows)')
+    else:
+        mismatched = (legacy != engine).any(axis=1).sum()
+        raise SystemExit(f'outputs differ in {mismatched} of {len(engine)} rows')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--SCALE', type=int, default=10,
+        help='multiple of the number of US counties to generate')
+    args = vars(parser.parse_args())
+
+    main(args)
@@ -36,15 +36,16 @@ create_zip_acs_views() {
         $1
 }
 
-# Creates a view based on a given level
-# $1 = geography. Ideally should be congressional_district or state
+# Creates a view based on a given level. Geographies passed together are
+# fetched concurrently.
+# $@ = geographies. Ideally congressional_district and/or state
 create_acs_view() {
     $PROJ_PYTHON jobs/mk_acs_view.py \
         --API_KEY=${CENSUS_API_KEY} \
         --EST=acs1 \
         --START_YEAR=2017 \
         --END_YEAR=2019 \
-        --GEO=$1
+        --GEO $@
 }
 
 # plots vote history for congressional races from 2008 to 2020
@@ -74,27 +75,33 @@ launch_dash() {
     deactivate
 }
 
+# simplifies zip code shapes for the dashboard maps
+build_geometry_store() {
+    $PROJ_PYTHON jobs/mk_geometry_store.py
+}
+
+# compiles the dashboard's data into data/dashboard.bundle
+build_dashboard_bundle() {
+    $PROJ_PYTHON jobs/mk_dashboard_bundle.py
+}
+
+# precomputes district and state profiles, "$@" e.g. --EXPORT
+build_district_profiles() {
+    $PROJ_PYTHON jobs/mk_district_profiles.py "$@"
+}
+
 calculate_pvi() {
     $PROJ_PYTHON jobs/mk_pvi.py
 }
 
-# zip everything needed for streamlit
+# zip everything needed for streamlit. The dashboard reads all of its data from
+# the bundle, see build_dashboard_bundle. The sources aren't shipped, so a
+# missing or outdated bundle stops the dashboard with an error to rebuild it.
 zip_streamlit() {
     zip -r "zips/conf.zip" \
         "conf/censuskey.txt" \
         "conf/indicators.yml"
 
     zip -r "zips/data.zip" \
-        "data/1976-2018-house3.csv" \
-        "data/1976-2020-president.csv" \
-        "data/1976-2020-senate.csv" \
-        "data/2020-house-full.csv" \
-        "data/state_codes.txt" \
-        "data/acs1-congressional-district-indicators-2017-2019.csv" \
-        "data/acs1-state-indicators-2017-2019.csv" \
-        "data/acs-zcta5-cong-dist-indicators-2019.csv" \
-        "data/Daily Kos Elections 2012, 2016 & 2020 presidential election results for congressional districts used in 2020 elections - Results.csv" \
-        "data/tl_2019_us_zcta510" \
-        "data/pvi.csv" \
-        "data/tabula-2021 PVI By District.csv"
+        "data/dashboard.bundle"
 }
@@ -1,13 +1,66 @@
 """Make an dataset of socioeconomic indicators sourced from the one year estimates
     the American Community Survey provides. This code is generally used to populate
     congressional district and state socioeconomic indicators.
+
+    Results are kept in a partitioned warehouse (see
+    district_research.data.warehouse), so a run only fetches the years and
+    indicators the warehouse doesn't have yet. Derived indicators (see
+    conf/derived_indicators.yml) are then recomputed for every stored year and
+    written next to them. The range asked for is also written out as a csv.
 """
 import argparse
 import logging
 import yaml
 
+import numpy as np
 import pandas as pd
-from district_research.data.acs import get_acs_data_table
+from district_research.cache import ACSCache
+from district_research.data.acs import available_codes, get_acs_data_tables
+from district_research.data.derived import compute_derived, read_derived_indicators
+from district_research.data.warehouse import ACSWarehouse
+
+# column that identifies a row in each view, along with YEAR
+VIEW_KEYS = {'congressional district': 'CD', 'state': 'STUSAB'}
+
+
+def _get_year_indicators(indicators, year):
+    """The census renumbered several codes in 2017, so older years use the
+        past set of codes."""
+    return indicators['current'] if year >= 2017 else indicators['past']
+
+
+def _create_view(table, year, geo, indicators, state_codes):
+    """Renames the raw ACS table for one year and geography into the view we
+        store. Only the indicators that were fetched are kept."""
+    year_indicators = _get_year_indicators(indicators, year)
+    data = (
+        table
+        .rename(columns={'state':'STATE'})
+        .rename(columns=year_indicators)
+        .rename(columns={
+            '{}A'.format(k): '{} Error Code'.format(v) for k,v in year_indicators.items()
+        })
+        .merge(state_codes, how='left', on='STATE')
+    )
+    data['YEAR'] = year
+    names = [v for v in indicators['current'].values() if v in data.columns]
+
+    if geo == 'congressional district':
+        data['CD'] = (data['STUSAB']
+            + '-'
+            + data['congressional district']
+                .astype(str)
+                .str.pad(2, 'left', '0')
+                .replace('00','01')
+        )
+
+        data = data[~data['CD'].str.endswith('ZZ')][['CD', 'YEAR', *names]]
+
+    elif geo == 'state':
+        data = data[['STUSAB', 'YEAR', *names]]
+
+    return data
+
 
 def main(args):
     logging.basicConfig(level=logging.INFO)
@@ -16,57 +69,89 @@ def main(args):
     API_KEY = args['API_KEY']
     START_YEAR = args['START_YEAR']
     END_YEAR = args['END_YEAR']
-    GEO = args['GEO'].replace('_', ' ')
+    GEOS = [g.replace('_', ' ') for g in args['GEO']]
     EST = args['EST']
+    cache = ACSCache(args['CACHE_DIR'], offline=args['OFFLINE'])
+    warehouse = ACSWarehouse(args['WAREHOUSE_DIR'])
 
     with open('conf/indicators.yml', 'r') as f:
         indicators = yaml.safe_load(f)
+    names = list(indicators['current'].values())
+    derived = read_derived_indicators(args['DERIVED_INDICATORS'])
+    years = range(START_YEAR, END_YEAR+1)
+
     logging.info('Reading in state codes...')
     state_codes = pd.read_csv('data/state_codes.txt', sep='|')
     state_codes['STATE'] = state_codes['STATE'].astype(str).str.pad(2, 'left', '0')
     logging.info(f'\tcount: {len(state_codes)}')
 
-    logging.info(f'Getting indicator data for {GEO}s from ACS API from {START_YEAR} to {END_YEAR}')
+    # only (year, indicator) cells missing from the warehouse are fetched,
+    # unless we are asked to refresh everything.
+    jobs = []
+    # indicators the API doesn't have for a year, by (geography, year)
+    absent = {}
+    for geo in GEOS:
+        if args['REFRESH']:
+            missing = {y: names for y in years}
+        else:
+            missing = warehouse.missing(EST, geo, years, names)
 
-    data = pd.concat([(
-        get_acs_data_table(API_KEY, EST, str(y), GEO, '*', *indicators['current'])
-        .rename(columns={'state':'STATE'})
-        .rename(columns=indicators['current'])
-        .rename(columns={
-            '{}A'.format(k): '{} Error Code'.format(v) for k,v in indicators['current'].items()
-        })
-        .merge(state_codes, how='left', on='STATE')
-    ) if y>=2017 else
-    (
-        get_acs_data_table(API_KEY, EST, str(y), GEO, '*', *indicators['past'])
-        .rename(columns={'state':'STATE'})
-        .rename(columns=indicators['past'])
-        .rename(columns={
-            '{}A'.format(k): '{} Error Code'.format(v) for k,v in indicators['past'].items()
-        })
-        .merge(state_codes, how='left', on='STATE')
-    ) for y in range(START_YEAR, END_YEAR+1)]).reset_index(drop=True)
+        for y, cols in missing.items():
+            year_indicators = _get_year_indicators(indicators, y)
+            codes = [k for k,v in year_indicators.items() if v in cols]
+            fetched = available_codes(y, codes)
+            if fetched:
+                jobs.append((EST, str(y), geo, fetched))
+            absent[geo, y] = [year_indicators[c] for c in codes if c not in fetched]
 
-    if GEO == 'congressional district':
-        data['CD'] = (data['STUSAB'] 
-            + '-' 
-            + data['congressional district']
-                .astype(str)
-                .str.pad(2, 'left', '0')
-                .replace('00','01')
+    # every (geography, year) table is requested at once so the whole update
+    # takes about as long as the slowest request.
+    logging.info(f'Getting {len(jobs)} missing tables for {", ".join(GEOS)} from ACS API from {START_YEAR} to {END_YEAR}')
+    tables = get_acs_data_tables(
+        API_KEY, jobs, max_workers=args['WORKERS'], cache=cache, concat=False
+    )
+
+    for (_, year, geo, _), table in zip(jobs, tables):
+        warehouse.write(
+            EST, geo, int(year),
+            _create_view(table, int(year), geo, indicators, state_codes),
+            key=[VIEW_KEYS[geo], 'YEAR']
         )
-    
-        data = data[~data['CD'].str.endswith('ZZ')][['CD', 'YEAR', *indicators['current'].values()]]
 
-    elif args['GEO'] == 'state':
-        data = data[['STUSAB', 'YEAR', *indicators['current'].values()]]
+    # indicators the API doesn't have for a year (see available_codes) are
+    # stored as empty columns, otherwise the warehouse would report them
+    # missing and they would be requested again on every run
+    for (geo, year), absent_names in absent.items():
+        if absent_names and year in warehouse.years(EST, geo):
+            key = VIEW_KEYS[geo]
+            empty = warehouse.read(EST, geo, year, year, columns=[key, 'YEAR'])
+            for name in absent_names:
+                empty[name] = np.nan
+            warehouse.write(EST, geo, year, empty, key=[key, 'YEAR'])
 
-    logging.info(f'\tcount: {len(data)}')
-    logging.info('Writing File...')
-    data.to_csv(
-        f'data/{EST}-{GEO.replace(" ", "-")}-indicators-{START_YEAR}-{END_YEAR}.csv', 
-        index=False
-    )
+    # derived indicators compare geographies within a year and years within a
+    # geography, so they are computed over everything stored in one pass
+    logging.info(f'Computing {len(derived)} derived indicators...')
+    for geo in GEOS:
+        key = VIEW_KEYS[geo]
+        derived_df = compute_derived(
+            warehouse.read(EST, geo, columns=[key, 'YEAR', *names]), key, derived
+        )
+        for year, group in derived_df.groupby('YEAR', sort=True):
+            warehouse.write(EST, geo, int(year), group, key=[key, 'YEAR'])
+
+    for geo in GEOS:
+        data = warehouse.read(
+            EST, geo, START_YEAR, END_YEAR,
+            columns=[VIEW_KEYS[geo], 'YEAR', *names, *derived]
+        )
+
+        logging.info(f'\t{geo} count: {len(data)}')
+        logging.info('Writing File...')
+        data.to_csv(
+            f'data/{EST}-{geo.replace(" ", "-")}-indicators-{START_YEAR}-{END_YEAR}.csv',
+            index=False
+        )
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
@@ -74,7 +159,21 @@ if __name__ == '__main__':
     parser.add_argument('--EST', type=str, help='Type of acs estimate (acs5 or acs1)')
     parser.add_argument('--START_YEAR', type=int, help='first year to collect data for')
     parser.add_argument('--END_YEAR', type=int, help='last year to collect data for')
-    parser.add_argument('--GEO', type=str, help='geography to collect data for')
+    parser.add_argument('--GEO', type=str, nargs='+',
+        choices=['congressional_district', 'state'],
+        help='one or more geographies to collect data for')
+    parser.add_argument('--WORKERS', type=int, default=8,
+        help='number of ACS API requests to run at once')
+    parser.add_argument('--CACHE_DIR', type=str, default='data/cache/acs',
+        help='directory used to cache ACS API responses')
+    parser.add_argument('--OFFLINE', action='store_true',
+        help='only use cached ACS responses, fail instead of calling the API')
+    parser.add_argument('--WAREHOUSE_DIR', type=str, default='data/warehouse/acs',
+        help='directory of the partitioned ACS warehouse')
+    parser.add_argument('--DERIVED_INDICATORS', type=str, default='conf/derived_indicators.yml',
+        help='declarations of the indicators derived from the ACS indicators')
+    parser.add_argument('--REFRESH', action='store_true',
+        help='refetch every year instead of only the cells missing from the warehouse')
     args = vars(parser.parse_args())
 
     main(args)
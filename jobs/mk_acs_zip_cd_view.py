@@ -11,8 +11,9 @@ import yaml
 import pandas as pd
 import geopandas as gpd
 
+from district_research.cache import ACSCache, MapCache
 from district_research.data.acs import get_acs_data_table
-from district_research.viz import plot_district_characteristic
+from district_research.viz import DistrictMapTable, render_district_maps
 
 def main(args):
     logging.basicConfig(level=logging.INFO)
@@ -21,6 +22,7 @@ def main(args):
     API_KEY = args['API_KEY']
     YEAR = args['YEAR']
     EST = args['EST']
+    cache = ACSCache(args['CACHE_DIR'], offline=args['OFFLINE'])
 
     with open('conf/districts.txt', 'r') as f:
         districts = f.readlines()
@@ -54,7 +56,8 @@ def main(args):
 
     logging.info('Getting indicator data for ZCTAs from ACS API')
     vars_to_plot = get_acs_data_table(
-        API_KEY, EST, YEAR, 'zip code tabulation area', '*', *indicators
+        API_KEY, EST, YEAR, 'zip code tabulation area', '*', *indicators,
+        cache=cache, stream=True
     ).rename(columns = {'zip code tabulation area': 'ZCTA5'})
     logging.info(f'\tcount: {len(vars_to_plot)}')
 
@@ -72,13 +75,14 @@ def main(args):
     logging.info(f'\tcount: {len(df)}')
     logging.info(f'\tnull rate:\n\t\t{pd.isnull(df).sum()/len(df)}')
     if args['SAVE_MAPS']:
-        for d in districts:
-            logging.info(f'Making maps for {d}...')
-            for i in indicators:
-                plot_district_characteristic(
-                    df, d, i,
-                    title=f'{indicators[i]} ({d})', save_dir=f'outputs/{d}'
-                )
+        logging.info(f'Making maps for {len(districts)} districts...')
+        map_table = DistrictMapTable(df, list(indicators.values()))
+        saved = render_district_maps(
+            map_table, districts, list(indicators.values()),
+            save_dir='outputs', workers=args['WORKERS'],
+            cache=MapCache(args['MAP_CACHE_DIR'])
+        )
+        logging.info(f'\tsaved {len(saved)} maps')
     else:
         logging.info('Saving dataset without geometry...')
 
@@ -102,6 +106,14 @@ if __name__ == '__main__':
     parser.add_argument('--SAVE_VIEW', dest='SAVE_MAPS', action='store_false',
         help="""Saves dataset created from this script.""")
     parser.set_defaults(SAVE_MAPS=True)
+    parser.add_argument('--CACHE_DIR', type=str, default='data/cache/acs',
+        help='directory used to cache ACS API responses')
+    parser.add_argument('--OFFLINE', action='store_true',
+        help='only use cached ACS responses, fail instead of calling the API')
+    parser.add_argument('--WORKERS', type=int, default=None,
+        help='number of processes used to render maps, defaults to every core')
+    parser.add_argument('--MAP_CACHE_DIR', type=str, default='data/cache/maps',
+        help='directory used to cache rendered maps, shared with the dashboard')
     args = vars(parser.parse_args())
 
     main(args)
\ No newline at end of file
@@ -1,13 +1,46 @@
+"""Calculates county level PVI for every presidential election in the store of
+    PVI aggregates (see district_research.data.pvi_store). Only years of
+    returns the store doesn't have yet are aggregated, so adding a new election
+    only needs that year's returns, e.g. a file with just the new year.
+"""
+import argparse
+import logging
+
+import numpy as np
 import pandas as pd
 
-from district_research.data.pvi import calculate_pvi, clean_cook_pvi
+from district_research.data.pvi import format_pvi, pvi_percentile
+from district_research.data.pvi_store import PVIStore
+
+LEVEL = 'county_fips'
+
+def main(args):
+    logging.basicConfig(level=logging.INFO)
+    store = PVIStore(args['STORE_DIR'])
 
-def main():
+    df = pd.read_csv(args['RETURNS'])
+    if not args['REFRESH']:
+        df = df[~df['year'].isin(store.years(LEVEL))]
 
-    df = pd.read_csv('data/countypres_2000-2020.csv')
-    pvi_df = calculate_pvi(df, 'county_fips')
-    pvi_df['county_pvi_pct'] = pvi_df.groupby('year')['pvi'].transform(clean_cook_pvi, do_rank=True)
+    if len(df):
+        logging.info(f'Adding county returns for {sorted(df["year"].unique())}')
+        store.add_returns(df, LEVEL)
+
+    pvi_df = store.calculate_pvi(LEVEL, formatted=False)
+
+    # percentile of the whole-number PVI within each year
+    pvi_df['county_pvi_pct'] = pvi_percentile(np.trunc(pvi_df['pvi']), groups=pvi_df['year'])
+    pvi_df['pvi'] = format_pvi(pvi_df['pvi'], pvi_df['party'])
     pvi_df.to_csv('data/countypres_pvi.csv', index=False)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--RETURNS', type=str, default='data/countypres_2000-2020.csv',
+        help='csv of county presidential returns, can be only the new years')
+    parser.add_argument('--STORE_DIR', type=str, default='data/warehouse/pvi',
+        help='directory of the PVI aggregate store')
+    parser.add_argument('--REFRESH', action='store_true',
+        help='re-aggregate every year in RETURNS instead of only new ones')
+    args = vars(parser.parse_args())
+
+    main(args)
@@ -0,0 +1,74 @@
+"""Calculates PVI for a geography we don't have returns for, such as ZCTAs for
+    canvassing or the districts of a new plan, by allocating county level
+    presidential returns through a crosswalk (see
+    district_research.data.crosswalk).
+
+    The crosswalk is expected in the geocorr csv format: short column names on
+    the first line and labels on the second. E.g. a county to ZCTA file from
+    geocorr2018 has the columns county, zcta5 and afact.
+
+    Usage:
+        python jobs/mk_crosswalk_pvi.py \
+            --CROSSWALK data/geocorr2018-county-zcta5.csv \
+            --TARGET_COL zcta5 --OUTPUT data/zcta5-pvi.csv
+"""
+import argparse
+import logging
+
+import pandas as pd
+
+from district_research.data.crosswalk import Crosswalk
+from district_research.data.pvi import calculate_crosswalk_pvi, format_pvi, pvi_percentile
+
+def main(args):
+    logging.basicConfig(level=logging.INFO)
+
+    logging.info('Reading county returns...')
+    df = pd.read_csv(args['RETURNS'])
+    df = df[pd.notnull(df['county_fips'])]
+    # fips codes and ZCTAs are ids with leading zeros, so both sides of the
+    # crosswalk are matched as zero padded strings
+    df['county_fips'] = df['county_fips'].astype(int).astype(str).str.pad(5, 'left', '0')
+
+    logging.info('Reading crosswalk...')
+    crosswalk_df = pd.read_csv(
+        args['CROSSWALK'], skiprows=[1],
+        dtype={args['SOURCE_COL']: str, args['TARGET_COL']: str}
+    )
+    crosswalk_df[args['SOURCE_COL']] = crosswalk_df[args['SOURCE_COL']].str.strip().str.pad(5, 'left', '0')
+    if args['TARGET_WIDTH']:
+        crosswalk_df[args['TARGET_COL']] = (
+            crosswalk_df[args['TARGET_COL']].str.strip().str.pad(args['TARGET_WIDTH'], 'left', '0')
+        )
+    crosswalk = Crosswalk(
+        crosswalk_df, args['SOURCE_COL'], args['TARGET_COL'], weight_col=args['WEIGHT_COL']
+    )
+    logging.info(f'\t{len(crosswalk.sources)} counties into {len(crosswalk.targets)} {args["TARGET_COL"]}')
+
+    logging.info('Calculating PVI...')
+    pvi_df = calculate_crosswalk_pvi(
+        df, 'county_fips', crosswalk, target_col=args['TARGET_COL'], formatted=False
+    )
+    pvi_df['pvi_pct'] = pvi_percentile(pvi_df['pvi'], groups=pvi_df['year'])
+    pvi_df['pvi'] = format_pvi(pvi_df['pvi'], pvi_df['party'])
+    logging.info(f'\tcount: {len(pvi_df)}')
+
+    pvi_df.to_csv(args['OUTPUT'], index=False)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--RETURNS', type=str, default='data/countypres_2000-2020.csv',
+        help='csv of county presidential returns')
+    parser.add_argument('--CROSSWALK', type=str, help='geocorr csv from counties to the target geography')
+    parser.add_argument('--SOURCE_COL', type=str, default='county',
+        help='crosswalk column with the county fips code')
+    parser.add_argument('--TARGET_COL', type=str, default='zcta5',
+        help='crosswalk column with the target geography')
+    parser.add_argument('--TARGET_WIDTH', type=int, default=5,
+        help='zero pad target ids to this width (5 for ZCTAs), 0 to leave them as is')
+    parser.add_argument('--WEIGHT_COL', type=str, default='afact',
+        help='crosswalk column with the share of the county in the target')
+    parser.add_argument('--OUTPUT', type=str, help='where to write the PVI csv')
+    args = vars(parser.parse_args())
+
+    main(args)
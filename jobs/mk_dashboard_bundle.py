@@ -0,0 +1,47 @@
+"""Compiles every dataset the dashboard reads into a single memory mapped
+    bundle (see district_research.data.bundle): cleaned election results,
+    presidential results by district, PVI tables, ACS panels, ZCTA indicators
+    and simplified geometry. The dashboard opens the bundle instead of parsing
+    the csvs and shapes it was built from.
+
+    Usage:
+        python jobs/mk_dashboard_bundle.py --BUNDLE_PATH data/dashboard.bundle
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+# the dashboard's datasets are defined next to it, in streamlit/store.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'streamlit'))
+
+from store import BUNDLE_PATH, BUNDLE_VERSION, make_source_store, write_dashboard_bundle
+
+def main(args):
+    logging.basicConfig(level=logging.INFO)
+
+    logging.info('Reading dashboard datasets from the sources...')
+    store = make_source_store(args['DATA_DIR'], args['CONF_DIR'])
+    store.preload()
+
+    logging.info(f'Writing bundle version {BUNDLE_VERSION} to {args["BUNDLE_PATH"]}...')
+    start = time.perf_counter()
+    write_dashboard_bundle(store, args['BUNDLE_PATH'])
+    logging.info(
+        f'\t{os.path.getsize(args["BUNDLE_PATH"]) / 1024 ** 2:.1f} MB '
+        f'in {time.perf_counter() - start:.1f}s'
+    )
+    logging.info('Done')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--DATA_DIR', type=str, default='data',
+        help='directory the source data is in')
+    parser.add_argument('--CONF_DIR', type=str, default='conf',
+        help='directory the configs are in')
+    parser.add_argument('--BUNDLE_PATH', type=str, default=BUNDLE_PATH,
+        help='file to write the bundle to')
+    args = vars(parser.parse_args())
+
+    main(args)
@@ -0,0 +1,58 @@
+"""Precomputes the profile of every district and state the dashboard shows
+    (see district_research.profiles) and writes them to an indexed bundle.
+    Optionally exports the profiles of the districts in conf/districts.txt for
+    reports, next to their maps in outputs/{district}.
+
+    Usage:
+        python jobs/mk_district_profiles.py --EXPORT
+"""
+import argparse
+import logging
+import os
+import sys
+
+# the dashboard's datasets are defined next to it, in streamlit/store.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'streamlit'))
+
+from district_research.profiles import PROFILES_PATH, DistrictProfiles, export_profile, write_profiles
+from store import build_dashboard_profiles, make_source_store
+
+def main(args):
+    logging.basicConfig(level=logging.INFO)
+
+    logging.info('Reading dashboard datasets from the sources...')
+    store = make_source_store(args['DATA_DIR'], args['CONF_DIR'])
+
+    logging.info('Building profiles...')
+    tables = build_dashboard_profiles(store)
+    logging.info(f'\tcount: {len(tables["profiles"])}')
+
+    logging.info(f'Writing profiles to {args["PROFILES_PATH"]}...')
+    write_profiles(tables, args['PROFILES_PATH'])
+
+    if args['EXPORT']:
+        with open(os.path.join(args['CONF_DIR'], 'districts.txt'), 'r') as f:
+            districts = [x.strip() for x in f.readlines() if x.strip()]
+
+        logging.info(f'Exporting profiles for {len(districts)} districts...')
+        profiles = DistrictProfiles.from_bundle(args['PROFILES_PATH'])
+        for district in districts:
+            if not export_profile(profiles, district, os.path.join(args['SAVE_DIR'], district)):
+                logging.warning(f'\tno profile for {district}')
+    logging.info('Done')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--DATA_DIR', type=str, default='data',
+        help='directory the source data is in')
+    parser.add_argument('--CONF_DIR', type=str, default='conf',
+        help='directory the configs are in')
+    parser.add_argument('--PROFILES_PATH', type=str, default=PROFILES_PATH,
+        help='file to write the profiles to')
+    parser.add_argument('--EXPORT', action='store_true',
+        help='export the profiles of the districts in conf/districts.txt')
+    parser.add_argument('--SAVE_DIR', type=str, default='outputs',
+        help='exports go in {SAVE_DIR}/{district}')
+    args = vars(parser.parse_args())
+
+    main(args)
@@ -0,0 +1,50 @@
+"""Builds the store of simplified ZCTA geometries the dashboard maps read (see
+    district_research.data.geometry). Shapes are simplified at a few
+    tolerances and written by state, using the ZCTA to congressional district
+    crosswalk to place each ZCTA in its states.
+"""
+import argparse
+import logging
+
+import geopandas as gpd
+import pandas as pd
+
+from district_research.data.geometry import TOLERANCES, GeometryStore
+
+def main(args):
+    logging.basicConfig(level=logging.INFO)
+    YEAR = args['YEAR']
+
+    logging.info('Reading zip code shape files...')
+    shape_df = (
+        gpd.read_file(f'data/tl_{YEAR}_us_zcta510/tl_{YEAR}_us_zcta510.shp')
+        .rename(columns={'ZCTA5CE10': 'ZCTA5'})
+    )
+    logging.info(f'\tcount: {len(shape_df)}')
+
+    logging.info('Reading ztca to state crosswalk...')
+    states_df = (
+        pd.read_csv('data/geocorr2018.csv', header=1)
+        .rename(columns={
+            'ZIP census tabulation area': 'ZCTA5',
+            'State abbreviation': 'STUSAB',
+        })
+    )
+    states_df['ZCTA5'] = states_df['ZCTA5'].astype(str).str.pad(5, 'left', '0')
+
+    logging.info(f'Writing simplified geometries at tolerances {args["TOLERANCES"]}...')
+    GeometryStore(args['STORE_DIR']).build(
+        shape_df, states_df, tolerances=args['TOLERANCES']
+    )
+    logging.info('Done')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--YEAR', type=str, default='2019', help='year of the shapefile')
+    parser.add_argument('--STORE_DIR', type=str, default='data/warehouse/geometry',
+        help='directory of the geometry store')
+    parser.add_argument('--TOLERANCES', type=float, nargs='+', default=list(TOLERANCES),
+        help='simplification tolerances in degrees')
+    args = vars(parser.parse_args())
+
+    main(args)
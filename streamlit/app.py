@@ -5,16 +5,15 @@ import streamlit as st
 import numpy as np
 import pandas as pd
 import seaborn as sns
-import yaml
 
-from district_research.viz import plot_district_characteristic
-from district_research.data.pvi import clean_cook_pvi, clean_cook_pvi_2020
-from district_research.data.elections import clean_daily_kos2020
+from district_research.viz import render_district_map
+from district_research.data.pvi import SwingSimulator
 
 import views as vw
+from store import get_data_store
 
-def center_obj(obj, title):
-    container = st.beta_container()
+def center_obj(obj, title, container=None):
+    container = container or st.beta_container()
     col1, col2, col3 = container.beta_columns([1, 4, 1])
 
     col1.write('')
@@ -22,59 +21,38 @@ def center_obj(obj, title):
     col2.write(obj)
     col3.write('')
 
+def centered(title):
+    """Renders a section's result with center_obj."""
+    return lambda container, obj: center_obj(obj, title, container)
+
+def sentence(container, text):
+    p1, p2, p3 = container.beta_columns([3, 10, 1])
+    p2.markdown(text or '')
+
 def main():
     st.set_page_config(layout='wide')
-    # read in data
-    house_df = vw.read_general_election_df('house')
-    senate_df = vw.read_general_election_df('senate')
-    president_df = vw.read_general_election_df('president')
-    pres_cd_df = clean_daily_kos2020(pd.read_csv(
-        'data/Daily Kos Elections 2012, 2016 & 2020 presidential election results for congressional districts used in 2020 elections - Results.csv',
-        header=1
-        ))
-
-    pvi_2017 = pd.read_csv('data/pvi.csv')
-    pvi_2017['Dist'] = pvi_2017['Dist'].str.replace('-AL', '-01')
-    pvi_2017['pvi_pct'] = clean_cook_pvi(pvi_2017['PVI'], True)
-
-    state_codes = pd.read_csv('data/state_codes.txt', sep='|')
-    pvi_2020 = pd.read_csv('data/tabula-2021 PVI By District.csv', header=None)
-    pvi_2020 = clean_cook_pvi_2020(pvi_2020, state_codes)
-
-    states_list = np.unique(house_df['state_po'].values).tolist()
-    map_df = vw.make_map_table()
-
-    with open('conf/indicators.yml', 'r') as f:
-        indicators = yaml.safe_load(f)
-    indicators_rev = {v: k for k,v in indicators['current'].items()}
-
-    cd_df = (
-        pd.read_csv('data/acs1-congressional-district-indicators-2017-2019.csv')
-    )
-    state_df = (
-        pd.read_csv('data/acs1-state-indicators-2017-2019.csv')
-    )
-    
-    state = st.sidebar.selectbox('Select State', states_list)
-
-    # some districts may have disappeared by 2020 because of redistricting that
-    # happened because of the 2010 Census. Therefore we only look at districts
-    # that were valid in 2010. TODO: make this flexible, based on previous
-    # election year or something.
-    district_list = (
-        np.unique(
-            house_df
-            [(house_df['state_po'] == state) & (house_df['year'] == 2020)]
-            ['district'].values
-        )
-        .tolist() + ['SN']
-    )
-
-    district_num = st.sidebar.selectbox('Select District', district_list)
+    # read in data. Every dataset is loaded once per process and shared by
+    # all sessions, so reruns only read what changed on disk.
+    store = get_data_store()
+    pres_cd_df = store.get('pres_cd')
+    # turnout tables, indicators and sentences for every selection are
+    # computed once, so a selection only looks them up
+    profiles = store.get('profiles')
+    indicators = store.get('indicators')
+    cd_df = store.get('cd_acs')
+    state_df = store.get('state_acs')
+    district_lists = store.get('district_lists')
+
+    state = st.sidebar.selectbox('Select State', list(district_lists))
+    district_num = st.sidebar.selectbox('Select District', district_lists[state])
     CD = f'{state}-{district_num}'
+    profile = profiles.profile(CD)
 
     ind = st.sidebar.selectbox('Plot Census Indicator', list(indicators['current'].values()))
 
+    swing = st.sidebar.slider('Presidential Swing (points toward Democrats)', -10.0, 10.0, 0.0, 0.5)
+    swing_method = st.sidebar.radio('Swing Method', SwingSimulator.METHODS)
+
     # to center title
     c1 = st.beta_container()
     t1, t2, t3 = c1.beta_columns([3, 10, 1])
@@ -82,92 +60,87 @@ def main():
     t2.title(f'District Research for {CD}')
     t3.write('')
 
+    # sections don't depend on each other, so they are computed on a worker
+    # pool and each one is drawn in its place as soon as it is done. Sections
+    # are (compute, render) pairs in page order, with pooled=False as a third
+    # element for the trivial ones (see vw.submit_sections).
+    sections = []
     if district_num != 'SN':
-        center_obj(
-            vw.get_historical_turnout_plot(
-                house_df,  
-                state, 
-                district_num
-            ), 'Historical District-Level House General Election Results* (Counts)'
-        )
-
-        center_obj(
-            vw.get_presidential_df_historical_pct_plot(pres_cd_df, CD),
-            f'Historical District-Level Presidential General Election Results (Percentages)'
-        )
-
-        center_obj(
-            vw.get_indicator_plot(cd_df, ind, state, district_num),
-            f'{ind} Over Time for {state}-{district_num}'
-        )
-    else:
-        center_obj(
-            vw.get_historical_turnout_plot(
-                senate_df,  
-                state, 
-                district_num
-            ), 'Historical Senate General Election Results*'
-        )
-
-        center_obj(
-            vw.get_indicator_plot(state_df, ind, state),
-            f'{ind} Over Time for {state}'
-        )
-
-    if district_num != 'SN':
-        ind_df = cd_df[(cd_df['CD'] == CD) & (cd_df['YEAR'] == 2019)][list(indicators['current'].values())].T
+        sections += [
+            (lambda: vw.plot_turnout_table(profiles.turnout('house', CD, with_turnout=False)),
+                centered('Historical District-Level House General Election Results* (Counts)')),
+            (lambda: vw.get_presidential_df_historical_pct_plot(pres_cd_df, CD),
+                centered('Historical District-Level Presidential General Election Results (Percentages)')),
+            (lambda: vw.get_indicator_plot(cd_df, ind, state, district_num),
+                centered(f'{ind} Over Time for {state}-{district_num}')),
+        ]
     else:
-        ind_df = state_df[(state_df['STUSAB'] == state) & (state_df['YEAR'] == 2019)][list(indicators['current'].values())].T
+        sections += [
+            (lambda: vw.plot_turnout_table(profiles.turnout('senate', state, with_turnout=False)),
+                centered('Historical Senate General Election Results*')),
+            (lambda: vw.get_indicator_plot(state_df, ind, state),
+                centered(f'{ind} Over Time for {state}')),
+        ]
 
-    ind_df.columns = ['Indicator Values']
-    center_obj(ind_df, f'{CD} Indicators')
+    # lookups in the precomputed profiles are quicker than a trip through the
+    # pool, so they are computed inline
+    sections.append((lambda: profiles.indicators(CD), centered(f'{CD} Indicators'), False))
 
     # TODO(itaher): Implement PVI stats for Senate
     if district_num != 'SN':
-        c2 = st.beta_container()
-        p1, p2, p3 = c2.beta_columns([3, 10, 1])
-        p2.markdown(vw.get_pvi_sentence(pvi_2020, CD, 2021))
-
-        c4 = st.beta_container()
-        p41, p42, p43 = c2.beta_columns([3, 10, 1])
-        p42.markdown(vw.get_pvi_sentence(pvi_2017, CD, 2017))
-    
-    c3 = st.beta_container()
-    p31, p32, p33 = c3.beta_columns([3, 10, 1])
-
-    if district_num == 'SN':
-        p32.markdown(vw.get_diversity_index(state_df, 'STUSAB', state))
-    else:
-        p32.markdown(vw.get_diversity_index(cd_df, 'CD', CD))
-
-    voting_age_pop_state_ct = state_df[(state_df['STUSAB'] == state) & (state_df['YEAR'] == 2019)]['Voting Age Population (Citizens)'].values[0]
+        sections += [
+            (lambda: profile['PVI_SENTENCE_2021'], sentence, False),
+            (lambda: profile['PVI_SENTENCE_2017'], sentence, False),
+        ]
+
+    def render_swing(container, swing_result):
+        p51, p52, p53 = container.beta_columns([3, 10, 1])
+        p52.markdown(f'**2020 Presidential Swing of {swing:+.1f}:** ' + vw.get_swing_sentence(swing_result, CD))
+        if swing_result['flipped'].any():
+            p52.write(
+                swing_result[swing_result['flipped']]
+                [['CD', 'dem_margin', 'pvi']]
+                .sort_values('dem_margin')
+                .reset_index(drop=True)
+            )
+
+    sections += [
+        (lambda: store.get('swing_simulator').simulate(swing, swing_method), render_swing),
+        (lambda: profile['DIVERSITY_SENTENCE'], sentence, False),
+    ]
 
     if district_num != 'SN':
-        voting_age_pop_cd_ct = cd_df[(cd_df['CD'] == CD) & (cd_df['YEAR'] == 2019)]['Voting Age Population (Citizens)'].values[0]
-        house_tbl = vw.get_historical_turnout_table(
-            house_df, state, district_num, voting_age_pop_cd_ct
-        )
-        center_obj(house_tbl, 'House (District)*')
-
-    senate_tbl = vw.get_historical_turnout_table(senate_df, state, None, voting_age_pop_state_ct)
-    president_tbl = vw.get_historical_turnout_table(president_df, state, None, voting_age_pop_state_ct)
-    center_obj(senate_tbl, 'Senate (Statewide)')
-    center_obj(president_tbl, 'President (Statewide)')
-
-
-    # empty line to separate election data from maps
-    st.text("")
-    # center map
-    map_con = st.beta_container()
-    em_map1, map2, em_map3 = map_con.beta_columns([1, 6, 1])
-
-    fig = plot_district_characteristic(
-        map_df, f'{state}-{district_num}', ind
-    )
-    
-    em_map1.write('')
-    map2.pyplot(fig)
-    em_map3.write('')
+        sections.append((lambda: profiles.turnout('house', CD), centered('House (District)*')))
+
+    sections += [
+        (lambda: profiles.turnout('senate', state), centered('Senate (Statewide)')),
+        (lambda: profiles.turnout('president', state), centered('President (Statewide)')),
+    ]
+
+    def render_map(container, png):
+        # empty line to separate election data from maps
+        container.text("")
+        # center map
+        em_map1, map2, em_map3 = container.beta_columns([1, 6, 1])
+        em_map1.write('')
+        map2.image(png)
+        em_map3.write('')
+
+    # maps are cached as images, so a district and indicator that has been
+    # viewed before is a memory or file read instead of a redraw. A new map is
+    # the slowest section, so it streams in last.
+    sections.append((
+        lambda: render_district_map(
+            store.get('map_table', state), f'{state}-{district_num}', ind,
+            cache=store.get('map_cache')
+        ),
+        render_map
+    ))
+
+    pending = vw.submit_sections(sections)
+
+    with st.sidebar.beta_expander('Data Load Timings'):
+        st.write(store.timings())
 
     st.markdown("***")
     st.subheader('Notes:')
@@ -183,5 +156,7 @@ def main():
     st.markdown('6. "TIGER/Line Shapefiles, 2019." *[Census](https://www.census.gov/geographies/mapping-files/time-series/geo/tiger-line-file.html)*')
     st.markdown('7. "Geographic Corresponence Engine." *[Missouri Census Data Center](https://mcdc.missouri.edu/applications/geocorr2018.html)*')
 
+    vw.render_sections(pending)
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,451 @@
+"""A process wide store of the datasets the dashboard reads. Each dataset is
+    loaded and cleaned once and shared by every session, so a rerun (e.g.
+    selecting a new district) is a dictionary lookup instead of a pass over the
+    csvs. A dataset is reloaded on its own when one of the files it was built
+    from changes, and how long each load took is kept for the sidebar.
+
+    Datasets come from one of two places. make_source_store reads and cleans
+    the raw csvs, the ACS warehouse and the geometry store. make_bundle_store
+    memory maps a single bundle of the already cleaned tables, built by
+    jobs/mk_dashboard_bundle.py, so a cold start doesn't parse any text. The
+    dashboard uses the bundle when there is one.
+"""
+import logging
+import inspect
+import os
+import threading
+import time
+
+import geopandas as gpd
+import pandas as pd
+import streamlit as st
+import yaml
+
+from district_research.cache import MapCache, file_digest
+from district_research.data.bundle import Bundle, write_bundle
+from district_research.data.derived import read_derived_indicators
+from district_research.data.elections import (
+    DAILY_KOS_SOURCES, ELECTION_SOURCES, GeneralElectionIndex, read_daily_kos,
+    read_general_election_df
+)
+from district_research.data.geometry import DEFAULT_TOLERANCE, GeometryStore
+from district_research.data.pvi import (
+    SwingSimulator, clean_cook_pvi, clean_cook_pvi_2020, party_shares
+)
+from district_research.data.warehouse import ACSWarehouse
+from district_research.profiles import DistrictProfiles, INDEXES as PROFILE_INDEXES, build_profiles
+
+import views as vw
+
+ACS_YEARS = (2017, 2019)
+
+BUNDLE_PATH = 'data/dashboard.bundle'
+# bump when the tables in the bundle or how they are cleaned change, so old
+# bundles are rebuilt instead of read
+BUNDLE_VERSION = 3
+
+ELECTION_TYPES = list(ELECTION_SOURCES)
+
+# datasets stored in the bundle as tables, the rest are kept in its metadata
+BUNDLE_TABLES = ['pres_cd', 'pvi_2017', 'pvi_2020', 'cd_acs', 'state_acs', 'zcta_indicators']
+# profile tables are stored in the bundle under this prefix
+PROFILES_PREFIX = 'profiles.'
+
+
+class DataStore:
+    """Memoizes datasets built from files on disk.
+
+        A dataset is registered with the files it is built from and a function
+        that builds it. get() builds it the first time and afterwards returns
+        the same object until one of the files changes. Files are compared by
+        modification time and size, or by a hash of their contents when
+        by_hash is set, which also catches a file replaced by one with an older
+        mtime. Files are checked at most once every check_interval seconds per
+        dataset, so reruns in between don't touch disk at all.
+
+        Datasets can take arguments, e.g. one map table per state. Each set of
+        arguments is memoized separately. A dataset built from other datasets
+        lists them as depends, and is rebuilt when any of their files change.
+
+        Args:
+            check_interval (float): Seconds between checks of a dataset's
+                files.
+    """
+
+    def __init__(self, check_interval=30):
+        self.check_interval = check_interval
+        self._datasets = {}
+        # (name, args) -> [signature, time of last check, value]
+        self._entries = {}
+        self._timings = {}
+        # reentrant since building a dataset usually gets the ones it is built
+        # from
+        self._lock = threading.RLock()
+
+    def register(self, name, sources, build, by_hash=False, depends=()):
+        """Registers a dataset.
+
+            Args:
+                name (str): Name the dataset is read by.
+                sources (list or callable): Paths of the files the dataset is
+                    built from, or a function of the dataset's arguments that
+                    returns them. A directory stands for every file under it.
+                build (callable): Function of the dataset's arguments that
+                    builds it.
+                by_hash (bool): Compare files by content instead of mtime.
+                depends (list): Datasets without arguments this one is built
+                    from.
+        """
+        self._datasets[name] = (sources, build, by_hash, tuple(depends))
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == name]:
+                del self._entries[key]
+
+    def get(self, name, *args):
+        """Returns a dataset, building it if it hasn't been built or its files
+            changed.
+        """
+        key = (name, args)
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[1] < self.check_interval:
+            return entry[2]
+
+        _, build, by_hash, _ = self._datasets[name]
+        with self._lock:
+            entry = self._entries.get(key)
+            signature = _signature(self._paths(name, args), by_hash)
+            if entry is not None and entry[0] == signature:
+                entry[1] = time.monotonic()
+                return entry[2]
+
+            start = time.perf_counter()
+            value = build(*args)
+            self._timings[key] = (time.perf_counter() - start, time.time())
+            self._entries[key] = [signature, time.monotonic(), value]
+
+            return value
+
+    def _paths(self, name, args=()):
+        sources, _, _, depends = self._datasets[name]
+        paths = list(sources(*args) if callable(sources) else sources)
+        for dependency in depends:
+            paths.extend(p for p in self._paths(dependency) if p not in paths)
+
+        return paths
+
+    def preload(self):
+        """Builds every dataset that takes no arguments."""
+        for name, (_, build, _, _) in list(self._datasets.items()):
+            parameters = inspect.signature(build).parameters.values()
+            if all(p.default is not p.empty for p in parameters):
+                self.get(name)
+
+    def missing(self):
+        """Returns the source files of datasets without arguments that don't
+            exist."""
+        paths = []
+        for name, (sources, _, _, _) in self._datasets.items():
+            if not callable(sources):
+                paths.extend(p for p in sources if not os.path.exists(p) and p not in paths)
+
+        return paths
+
+    def invalidate(self, name=None):
+        """Drops a dataset, or every dataset, so the next get() rebuilds it."""
+        with self._lock:
+            for key in [k for k in self._entries if name is None or k[0] == name]:
+                del self._entries[key]
+
+    def timings(self):
+        """Returns a DataFrame of the last load of each dataset: its name,
+            arguments, seconds it took and when it happened.
+        """
+        return pd.DataFrame(
+            [
+                (name, ', '.join(str(a) for a in args), seconds, pd.Timestamp(loaded_at, unit='s'))
+                for (name, args), (seconds, loaded_at) in self._timings.items()
+            ],
+            columns=['dataset', 'args', 'seconds', 'loaded_at']
+        )
+
+
+def _signature(paths, by_hash):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                files.extend(os.path.join(dirpath, f) for f in sorted(filenames) if not f.endswith('.tmp'))
+        else:
+            files.append(path)
+
+    if by_hash:
+        existing = [f for f in files if os.path.exists(f)]
+        return tuple(existing), file_digest(*existing)
+
+    signature = []
+    for f in files:
+        try:
+            stat = os.stat(f)
+            signature.append((f, stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            # a missing file is part of the signature too, so the dataset is
+            # rebuilt once it shows up
+            signature.append((f, None, None))
+
+    return tuple(signature)
+
+
+def make_dashboard_store(data_dir='data', conf_dir='conf', check_interval=30,
+    bundle_path=BUNDLE_PATH):
+    """Returns a store of the dashboard's datasets, read from the bundle at
+        bundle_path if there is one of the current version and from the
+        sources otherwise. Either way it also holds the MapCache every
+        session renders maps through, as 'map_cache'.
+
+        Raises:
+            FileNotFoundError if the bundle can't be used and the sources
+            aren't there either, e.g. a deployment that only ships the bundle
+            (see zip_streamlit in jobs/funs.sh).
+    """
+    store = None
+    reason = f'{bundle_path} does not exist'
+    if bundle_path and os.path.exists(bundle_path):
+        try:
+            store = make_bundle_store(bundle_path, check_interval)
+        except ValueError as e:
+            reason = str(e)
+
+    if store is None:
+        store = make_source_store(data_dir, conf_dir, check_interval)
+        missing = store.missing()
+        if missing:
+            raise FileNotFoundError(
+                f'{reason}, and the sources it is built from are missing '
+                f'({", ".join(missing)}). Rebuild the bundle with '
+                f'build_dashboard_bundle in jobs/funs.sh.'
+            )
+        logging.warning(f'Reading dashboard data from the sources: {reason}')
+
+    store.register('map_cache', [], MapCache)
+    return store
+
+
+def make_source_store(data_dir='data', conf_dir='conf', check_interval=30):
+    """Registers every dataset the dashboard reads, built from the sources.
+
+        Args:
+            data_dir (str): Directory the source data is in.
+            conf_dir (str): Directory the configs are in.
+            check_interval (float): See DataStore.
+
+        Returns:
+            A DataStore.
+    """
+    store = DataStore(check_interval)
+    warehouse = ACSWarehouse(os.path.join(data_dir, 'warehouse', 'acs'))
+    geometry = GeometryStore(os.path.join(data_dir, 'warehouse', 'geometry'))
+
+    def data(*files):
+        return [os.path.join(data_dir, f) for f in files]
+
+    indicators_path = os.path.join(conf_dir, 'indicators.yml')
+    derived_path = os.path.join(conf_dir, 'derived_indicators.yml')
+    kos_2020 = data(DAILY_KOS_SOURCES[2020]['file'])
+    pvi_2017_path, = data('pvi.csv')
+    pvi_2020_paths = data('tabula-2021 PVI By District.csv', 'state_codes.txt')
+    zcta_path, = data('acs-zcta5-cong-dist-indicators-2019.csv')
+
+    for election_type, files in ELECTION_SOURCES.items():
+        store.register(
+            f'{election_type}_index', data(*files),
+            lambda t=election_type: vw.read_general_election_index(t, data_dir)
+        )
+
+    store.register(
+        'district_lists', data(*ELECTION_SOURCES['house']),
+        lambda: vw.get_district_lists(read_general_election_df('house', data_dir))
+    )
+
+    store.register('pres_cd', kos_2020, lambda: read_daily_kos([2020], data_dir))
+    store.register(
+        'swing_simulator', kos_2020, lambda: SwingSimulator(
+            store.get('pres_cd'),
+            national_shares_df=party_shares(store.get('president_index').results)
+        ),
+        depends=['president_index']
+    )
+
+    def read_pvi_2017():
+        pvi_2017 = pd.read_csv(pvi_2017_path)
+        pvi_2017['Dist'] = pvi_2017['Dist'].str.replace('-AL', '-01')
+        pvi_2017['pvi_pct'] = clean_cook_pvi(pvi_2017['PVI'], True)
+        return pvi_2017
+
+    store.register('pvi_2017', [pvi_2017_path], read_pvi_2017)
+    store.register('pvi_2020', pvi_2020_paths, lambda: clean_cook_pvi_2020(
+        pd.read_csv(pvi_2020_paths[0], header=None),
+        pd.read_csv(pvi_2020_paths[1], sep='|')
+    ))
+
+    def read_indicators():
+        with open(indicators_path, 'r') as f:
+            return yaml.safe_load(f)
+
+    store.register('indicators', [indicators_path], read_indicators)
+    store.register('derived_indicators', [derived_path], lambda: read_derived_indicators(derived_path))
+
+    for name, geo, key in [('cd_acs', 'congressional district', 'CD'), ('state_acs', 'state', 'STUSAB')]:
+        store.register(
+            name,
+            lambda g=geo: [
+                warehouse.partition_path('acs1', g, y) for y in warehouse.years('acs1', g)
+                if ACS_YEARS[0] <= y <= ACS_YEARS[1]
+            ],
+            # derived indicators are read, not computed, see jobs/mk_acs_view.py
+            lambda g=geo, k=key: warehouse.read(
+                'acs1', g, *ACS_YEARS,
+                columns=[
+                    k, 'YEAR', *store.get('indicators')['current'].values(),
+                    *store.get('derived_indicators')
+                ]
+            ),
+            depends=['indicators', 'derived_indicators']
+        )
+
+    store.register('zcta_indicators', [zcta_path], lambda: vw.read_zcta_indicators(zcta_path))
+
+    def read_shapes(state):
+        return geometry.read(states=[state], columns=['ZCTA5'])
+
+    store.register(
+        'map_table',
+        lambda state: [zcta_path, geometry.partition_path(DEFAULT_TOLERANCE, state)],
+        lambda state: vw.make_map_table(store.get('zcta_indicators'), read_shapes(state), state)
+    )
+
+    store.register(
+        'profiles', [], lambda: DistrictProfiles.from_tables(build_dashboard_profiles(store)),
+        depends=[*(f'{t}_index' for t in ELECTION_TYPES), 'cd_acs', 'state_acs',
+            'pvi_2017', 'pvi_2020', 'district_lists']
+    )
+
+    # only used to build the bundle
+    store.register('geometry_states', [geometry.root], lambda: geometry.states(DEFAULT_TOLERANCE))
+    store.register(
+        'shapes', lambda state: [geometry.partition_path(DEFAULT_TOLERANCE, state)], read_shapes
+    )
+
+    return store
+
+
+def make_bundle_store(path=BUNDLE_PATH, check_interval=30):
+    """Registers every dataset the dashboard reads, memory mapped from a
+        bundle. Every dataset is rebuilt when the bundle file changes.
+
+        Raises:
+            ValueError if the file isn't a bundle of BUNDLE_VERSION.
+    """
+    store = DataStore(check_interval)
+    # fail now rather than on the first get
+    Bundle(path, BUNDLE_VERSION)
+
+    def register(name, build):
+        store.register(name, [path], build)
+
+    register('bundle', lambda: Bundle(path, BUNDLE_VERSION))
+
+    for election_type in ELECTION_TYPES:
+        register(
+            f'{election_type}_index',
+            lambda t=election_type: GeneralElectionIndex.from_results(
+                store.get('bundle').read(f'{t}_results'), t == 'house'
+            )
+        )
+
+    for name in BUNDLE_TABLES:
+        register(name, lambda n=name: store.get('bundle').read(n))
+
+    for name in ['indicators', 'district_lists']:
+        register(name, lambda n=name: store.get('bundle').metadata[n])
+
+    register('swing_simulator', lambda: SwingSimulator(
+        store.get('pres_cd'),
+        national_shares_df=party_shares(store.get('president_index').results)
+    ))
+    register('profiles', lambda: DistrictProfiles.from_bundle(store.get('bundle'), PROFILES_PREFIX))
+
+    def read_shapes(state):
+        bundle = store.get('bundle')
+        shape_df = bundle.read('geometry', state).drop('STUSAB', axis=1)
+        return gpd.GeoDataFrame(
+            shape_df.assign(geometry=gpd.GeoSeries.from_wkb(shape_df['geometry'].values)),
+            geometry='geometry', crs=bundle.metadata['geometry_crs']
+        )
+
+    store.register(
+        'map_table', [path],
+        lambda state: vw.make_map_table(store.get('zcta_indicators'), read_shapes(state), state)
+    )
+
+    return store
+
+
+def build_dashboard_profiles(store):
+    """Computes every district and state profile (see
+        district_research.profiles) from a store's datasets."""
+    return build_profiles(
+        {t: store.get(f'{t}_index').results for t in ELECTION_TYPES},
+        store.get('cd_acs'), store.get('state_acs'),
+        {2021: store.get('pvi_2020'), 2017: store.get('pvi_2017')},
+        store.get('district_lists')
+    )
+
+
+def write_dashboard_bundle(store, path=BUNDLE_PATH):
+    """Writes every dataset in a source store (see make_source_store) to a
+        bundle. Shapes are stored as WKB, indexed by state.
+    """
+    tables = {
+        f'{t}_results': store.get(f'{t}_index').results for t in ELECTION_TYPES
+    }
+    tables.update({name: store.get(name) for name in BUNDLE_TABLES})
+    tables.update({
+        PROFILES_PREFIX + name: df for name, df in build_dashboard_profiles(store).items()
+    })
+
+    shapes, crs = [], None
+    for state in store.get('geometry_states'):
+        shape_df = store.get('shapes', state)
+        crs = crs or shape_df.crs
+        shapes.append(pd.DataFrame({
+            'STUSAB': state,
+            'ZCTA5': shape_df['ZCTA5'].values,
+            'geometry': shape_df.geometry.to_wkb().values,
+        }))
+    tables['geometry'] = (
+        pd.concat(shapes, ignore_index=True) if shapes
+        else pd.DataFrame({'STUSAB': [], 'ZCTA5': [], 'geometry': []})
+    )
+
+    write_bundle(
+        path, tables, BUNDLE_VERSION,
+        metadata={
+            'indicators': store.get('indicators'),
+            'district_lists': store.get('district_lists'),
+            'geometry_crs': crs.to_wkt() if crs is not None else None,
+        },
+        indexes={
+            'geometry': 'STUSAB',
+            **{PROFILES_PREFIX + name: col for name, col in PROFILE_INDEXES.items()}
+        }
+    )
+
+
+@st.cache(allow_output_mutation=True)
+def get_data_store():
+    """Creates the dashboard's DataStore once per process and loads every
+        dataset, so all sessions share one copy."""
+    store = make_dashboard_store()
+    store.preload()
+    return store
@@ -2,74 +2,173 @@
     TODO(itaher): Determine what code belongs in views.py and what should be
     moved back into district_research
 """
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
 import pandas as pd
 import numpy as np
 import geopandas as gpd
-import streamlit as st
 import plotly.graph_objects as go
+import streamlit as st
+from streamlit.report_thread import get_report_ctx
+
+from district_research.data.elections import GeneralElectionIndex, read_general_election_df
+from district_research.profiles import DIVERSITY_INDEX, MINORITY_PERCENTAGE, diversity_sentence, pvi_sentence
+from district_research.viz import DistrictMapTable
+
+# computes dashboard sections for every session. Sections only compute, so the
+# pool's threads never call streamlit; drawing happens on the script thread.
+SECTION_WORKERS = 4
+_section_pool = ThreadPoolExecutor(SECTION_WORKERS, thread_name_prefix='dashboard-section')
+# each session's futures from its last run, cancelled when it reruns so a
+# burst of reruns doesn't queue ahead of other sessions
+_session_futures = {}
+_session_lock = threading.Lock()
+
+def submit_sections(sections):
+    """Reserves a container for each section, in page order, and starts
+        computing every section on the worker pool. Anything written after
+        this call goes below the sections. Sections this session submitted on
+        an earlier run that haven't started are cancelled.
 
-from district_research.data.elections import get_general_election_results
+        Args:
+            sections (list): (compute, render) pairs, or (compute, render,
+                pooled) where pooled=False computes on the script thread, for
+                lookups cheaper than a trip through the pool. compute takes no
+                arguments and must not call streamlit. render takes the
+                section's container and the result of compute.
 
-def _create_house_view():
-    """Creates the house view that'll be used to plot general election results."""
-    df = (
-        pd.read_csv('data/1976-2018-house3.csv')
-        [['year', 'state_po', 'district', 'party', 'candidatevotes', 'stage']]
-    )
-    df2020 = (
-        pd.read_csv('data/2020-house-full.csv')
-        [['year', 'state_po', 'district', 'party', 'candidatevotes', 'stage']]
-    )
+        Returns:
+            The pending sections, see render_sections.
+    """
+    ctx = get_report_ctx()
+    session_id = ctx.session_id if ctx is not None else None
+
+    pending = []
+    for compute, render, *options in sections:
+        pooled = options[0] if options else True
+        if pooled:
+            future = _section_pool.submit(compute)
+        else:
+            future = Future()
+            try:
+                future.set_result(compute())
+            except Exception as e:
+                future.set_exception(e)
+        pending.append((future, st.beta_container(), render))
+
+    with _session_lock:
+        for future in _session_futures.pop(session_id, []):
+            future.cancel()
+        # sessions that have closed leave their finished futures behind
+        for other in [k for k, fs in _session_futures.items() if all(f.done() for f in fs)]:
+            del _session_futures[other]
+        if session_id is not None:
+            _session_futures[session_id] = [future for future, _, _ in pending]
+
+    return pending
+
+
+def render_sections(pending):
+    """Draws each pending section as soon as its computation finishes, so the
+        page fills in from the fastest section rather than waiting for all of
+        them. A section that fails shows its error in its place. If the run is
+        stopped (e.g. by a rerun), sections that haven't started are
+        cancelled.
+    """
+    futures = {future: (container, render) for future, container, render in pending}
+    try:
+        for future in as_completed(futures):
+            container, render = futures[future]
+            try:
+                render(container, future.result())
+            except Exception as e:
+                container.exception(e)
+    finally:
+        for future in futures:
+            future.cancel()
+
+def read_general_election_index(election_type, data_dir='data'):
+    """Builds the normalized election results index for a race type, so
+        selecting a district or state is a lookup instead of reprocessing every
+        election. House results are indexed by district, senate and
+        presidential results by state. The dashboard's DataStore builds it
+        once per process.
 
-    final_df = pd.concat([df, df2020], axis=0)
+        Args:
+            election_type (str): A string denoting whether this is a 'house',
+                'senate' or 'president' race.
+            data_dir (str): Directory the source csvs are in.
 
-    final_df['district'] = (
-        final_df['district']
-        .replace(0, 1)
-        .astype(str)
-        .str.pad(2, 'left', '0')
+        Returns:
+            A GeneralElectionIndex.
+    """
+    return GeneralElectionIndex(
+        read_general_election_df(election_type, data_dir), election_type == 'house'
     )
 
-    return final_df
 
+def get_district_lists(house_df):
+    """Lists the districts that can be selected in each state.
 
-def read_general_election_df(election_type):
-    """Depending on the race type, reads in a csv of general election results.
-        If its the house, concats two datasets together to create up to date
-        results.
+        Some districts may have disappeared by 2020 because of redistricting
+        that happened because of the 2010 Census. Therefore we only look at
+        districts that were valid in 2010. TODO: make this flexible, based on
+        previous election year or something.
 
         Args:
-            election_type (str): A string denoting whether this is a 'house',
-                'senate' or 'presidential' race.
-        
+            house_df (Pandas DataFrame): Historical house results, see
+                read_general_election_df
+
         Returns:
-            A DataFrame of historical general election results.
+            A dict of state abbreviation to two digit district numbers, with
+            'SN' (the Senate, i.e. statewide) last. States are sorted.
     """
+    states = np.unique(house_df['state_po'].astype(str).values)
+    current = house_df[house_df['year'] == 2020]
+    districts = current.groupby(current['state_po'].astype(str))['district'].unique()
 
-    if election_type == 'house':
-        df = _create_house_view()
-    elif election_type == 'senate':
-        df = (
-            pd.read_csv('data/1976-2020-senate.csv')
-            .rename(columns={'party_detailed': 'party'})
-        )
-    else:
-        df = (
-            pd.read_csv('data/1976-2020-president.csv')
-            .rename(columns={'party_detailed': 'party'})
-        )
-    
-    return df
+    return {
+        s: [f'{d:02d}' for d in np.unique(districts.get(s, []))] + ['SN']
+        for s in states
+    }
+
+
+def get_swing_sentence(result, district):
+    """Summarizes a swing simulation for the selected district.
+
+        Arguments:
+            result (Pandas DataFrame): Output of SwingSimulator.simulate
+            district (str): The district to describe, e.g. 'NY-03'
+
+        Returns:
+            A markdown string.
+    """
+    dem_seats = int((result['dem_share'] > 0.5).sum())
+    sentence = (
+        f'Democrats would win {dem_seats} of {len(result)} districts '
+        f'({int(result["flipped"].sum())} flipped).'
+    )
+
+    row = result[result['CD'] == district]
+    if len(row):
+        margin = row['dem_margin'].values[0]
+        party = 'D' if margin > 0 else 'R'
+        flipped = ' (flipped)' if row['flipped'].values[0] else ''
+        sentence += f' {district} would be {party}+{abs(margin):.1f}{flipped}.'
 
+    return sentence
 
-def get_historical_turnout_table(df, state, district_num=None, voting_age_pop_ct=None):
+
+def get_historical_turnout_table(election_index, state, district_num=None, voting_age_pop_ct=None):
     """Takes a dataframe of election results and gets the results of elections
         for a given race (e.g. MO-01, MO-SN or MO-Pres) between 2008 and 2020.
         Also provides voter turnout % where the denominator is the 2019 Citizen
         Voting Age Population.
 
         Args:
-            df (Pandas DataFrame): DataFrame of election results
+            election_index (GeneralElectionIndex): Index of election results,
+                see read_general_election_index
             state (str): The abbreviation of the state we are interested in
                 getting results for
             district_num (str): The string that denotes the district number
@@ -83,10 +182,10 @@ def get_historical_turnout_table(df, state, district_num=None, voting_age_pop_ct
 
     if district_num and district_num != 'SN':
         district = state + '-' + district_num
-        res = get_general_election_results(df, 2012, 2020, district, True)
+        res = election_index.get_results(2012, 2020, district)
 
     else:
-        res = get_general_election_results(df, 2012, 2020, state, False)
+        res = election_index.get_results(2012, 2020, state)
     vw = (
         res.pivot_table(index='year', columns='party', 
             values='candidatevotes', aggfunc=np.sum)
@@ -100,11 +199,11 @@ def get_historical_turnout_table(df, state, district_num=None, voting_age_pop_ct
 
     return vw
 
-def get_historical_turnout_plot(df, state, district_num=None, voting_age_pop_ct=None):
+def get_historical_turnout_plot(election_index, state, district_num=None, voting_age_pop_ct=None):
     """Plots the historical turnout table returned from get_historical_turnout_table.
 
         Args:
-            df (Pandas DataFrame): DataFrame of election results
+            election_index (GeneralElectionIndex): Index of election results
             state (str): The abbreviation of the state we are interested in
                 getting results for
             district_num (str): The string that denotes the district number
@@ -116,8 +215,15 @@ def get_historical_turnout_plot(df, state, district_num=None, voting_age_pop_ct=
                 results.
     """
     
-    subset = get_historical_turnout_table(df, state, district_num, voting_age_pop_ct)
-    subset = subset.drop('TOTAL', axis=1).reset_index()
+    return plot_turnout_table(
+        get_historical_turnout_table(election_index, state, district_num, voting_age_pop_ct)
+    )
+
+
+def plot_turnout_table(table):
+    """Plots a historical turnout table (see get_historical_turnout_table or
+        DistrictProfiles.turnout) as a line graph of votes by party."""
+    subset = table.drop(['TOTAL', 'VOTER TURNOUT PERCENTAGE'], axis=1, errors='ignore').reset_index()
     subset_pivot = subset.melt(id_vars='year', var_name='PARTY', value_name='VOTES')
 
     fig = go.Figure()
@@ -174,14 +280,7 @@ def get_pvi_sentence(df, district, year):
             districts and the benchmark we'd like to achieve.
     """
     d = df[df['Dist'] == district]
-    pct = np.round(d['pvi_pct'].values[0] * 100, 2)
-
-    if pct > 50:
-        substr = f'bottom {100 - pct}%'
-    else:
-        substr = f'top {pct}%'
-
-    return f'This district\'s PVI ({year}) is **{d["PVI"].values[0]}**. That\'s in the **{substr}** most Democratic districts. Ideally this should be **at least D+24**.'
+    return pvi_sentence(d['PVI'].values[0], d['pvi_pct'].values[0], year)
 
 
 def get_indicator_plot(df, indicator, state, district_num=None):
@@ -216,50 +315,51 @@ def get_indicator_plot(df, indicator, state, district_num=None):
     return fig
 
 
-def get_diversity_index(df, geo, geo_val):
-    """Shannon Entropy of Racial Demographics
+def get_diversity_index(df, geo, geo_val, year=2019):
+    """Describes the racial diversity of an area, using the Racial Diversity
+        Index (percentile of the Shannon entropy of racial demographics) and
+        Minority Percentage derived when the ACS views are built (see
+        conf/derived_indicators.yml).
+
         Args:
-            df (Pandas DataFrame): DataFrame at some geography level with racial
-            percentages
+            df (Pandas DataFrame): DataFrame at some geography level with
+            derived indicators
             geo (str): Geography level (e.g. state, cd, etc.)
             geo_val (str): Corresponding code to geo
+            year (int): Year to describe
         Returns:
             A string that talks about the racial diversity index.
     """
+    area_vals = df[(df['YEAR'] == year) & (df[geo] == geo_val)]
 
-    subset = df[(df['YEAR'] == 2019)]
+    return diversity_sentence(
+        geo_val, area_vals[DIVERSITY_INDEX].values[0], area_vals[MINORITY_PERCENTAGE].values[0]
+    )
 
-    # racial characteristics
-    subset_race = subset[[
-        'Percent Black',
-        'Percent White',
-        'Percent Asian',
-        'Percent Latino',
-        'Percent Native Hawaiian and Other Pacific Islander',
-        'Percent American Indian and Alaska Native'
-    ]]
 
-    for c in subset_race.columns:
-        subset_race[c] = subset_race[c]/100 * np.log(subset_race[c]/100)
-    
-    subset['racial_diversity'] = -subset_race.sum(axis=1)
-    subset['racial_diversity_pct'] = subset['racial_diversity'].rank(pct=True)
+def read_zcta_indicators(path='data/acs-zcta5-cong-dist-indicators-2019.csv'):
+    """Reads socioeconomic indicators from the acs five year estimates by
+        ZCTA and Congressional District (see jobs/mk_acs_zip_cd_view.py).
+    """
+    indicator_df = pd.read_csv(path)
+    indicator_df['ZCTA5'] = indicator_df['ZCTA5'].astype(str).str.pad(5, 'left', '0')
+    return indicator_df
 
-    area_vals = subset[subset[geo] == geo_val][[geo, 'racial_diversity_pct', 'Percent White']]
 
-    return f'{geo_val}\'s Racial Diversity Index is {np.round(area_vals["racial_diversity_pct"].values[0], 2)} on a scale of 0.00 to 1.00. It\'s Minority Percentage is {100 - area_vals["Percent White"].values[0]}%.'
-    
+def make_map_table(indicator_df, shape_df, state):
+    """Uses simplified shapes and socioeconomic data from the acs five year
+        estimates to associate ZCTAs, Congressional Districts and socioeconomic
+        indicators for a state. The table is indexed by district so each map
+        only touches its rows.
 
-@st.cache(allow_output_mutation=True)
-def make_map_table():
-    """Uses shape files and socioeconomic data from the acs five year estimates
-        to associate ZCTAs, Congressional Districts and socioeconomic indicators.
+        Args:
+            indicator_df (Pandas DataFrame): See read_zcta_indicators
+            shape_df (Geopandas DataFrame): ZCTA5 and geometry columns for the
+                state's simplified shapes, see GeometryStore.read
+            state (str): State abbreviation, e.g. 'NY'
     """
-    indicator_df = pd.read_csv('data/acs-zcta5-cong-dist-indicators-2019.csv')
-    indicator_df['ZCTA5'] = indicator_df['ZCTA5'].astype(str).str.pad(5, 'left', '0')
+    indicator_df = indicator_df[indicator_df['CD'].str.startswith(state)]
 
-    shape_df = (
-        gpd.read_file('data/tl_2019_us_zcta510/tl_2019_us_zcta510.shp')
-        .rename(columns={'ZCTA5CE10': 'ZCTA5'})
+    return DistrictMapTable(
+        gpd.GeoDataFrame(indicator_df.merge(shape_df, how = 'left', on = 'ZCTA5'))
     )
-    return gpd.GeoDataFrame(indicator_df.merge(shape_df, how = 'left', on = 'ZCTA5'))